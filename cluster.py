@@ -0,0 +1,8 @@
+from main import sanityChecks
+
+if __name__ == '__main__':
+    # Runs the bot as several processes, see source/cluster.py
+    # QOTD_CLUSTERS sets how many (default: one per cpu core), QOTD_SHARD_COUNT how many shards they share
+    sanityChecks()
+    from source import cluster
+    cluster.launch()
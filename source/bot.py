@@ -2,8 +2,8 @@ import asyncio
 import logging
 import traceback
 from datetime import datetime
+from time import perf_counter
 
-import aiohttp
 import discord
 import discord_slash
 from discord_slash import SlashCommand, SlashContext, error
@@ -11,10 +11,25 @@ from discord_slash import SlashCommand, SlashContext, error
 from . import utilities, dataclass, monkeypatch
 
 log = utilities.getLog("Bot", level=logging.DEBUG)
-intents = discord.Intents.default()
-intents.members = True
+lowMemory = utilities.getLowMemoryMode()
+if lowMemory:
+    # nothing needs every member, so they aren't received, cached, or chunked
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.guild_reactions = True  # reaction polls, paginators and yes/no prompts
+else:
+    intents = discord.Intents.default()
+    intents.members = True
+shardCount, shardIDs = utilities.getShardConfig()
 
 bot = dataclass.Bot(
+    shard_count=shardCount,
+    shard_ids=shardIDs,
+    lowMemory=lowMemory,
+    chunk_guilds_at_startup=not lowMemory,
+    member_cache_flags=discord.MemberCacheFlags.from_intents(intents),
     command_prefix=">",
     description="Query",
     case_insensitive=True,
@@ -60,46 +75,42 @@ async def startupTasks():
     except Exception as e:
         log.error(e)
 
+    log.info("Loading guild configs...")
+    await bot.guildConfigs.loadAll()
+    bot.guildConfigs.refreshTask.start()
+
+    log.info("Acquiring shard leases...")
+    await bot.leases.start()
+    log.info(f"Holding leases for {len(bot.leases)}/{len(bot.leases.shards)} shards")
+
     log.info("Running cog setup tasks")
     for cog in bot.cogs:
         _c = bot.get_cog(cog)
         if hasattr(_c, "setup"):
             await _c.setup()
 
-    asyncio.create_task(statsUpdate())
-
+    bot.userCounts.loadAll(bot.guilds)
+    if bot.userCounts.approximate:
+        bot.userCounts.refreshTask.start()
+    bot.cluster.start()
+    bot.stats.request()
 
-async def statsUpdate():
-    if not bot.shouldUpdateBL:
-        return False
-    discordBots = f"https://discordbotlist.com/api/v1/bots/{bot.user.id}/stats"
 
-    dbHeaders = {
-        "Authorization": utilities.getDiscordBotsToken(),
-    }
+@bot.event
+async def on_shard_ready(shard_id):
+    log.info(f"Shard {shard_id} ready")
 
-    async with aiohttp.ClientSession(headers=dbHeaders) as session:
-        totalUsers = 0
-        for g in bot.guilds:
-            totalUsers += len([m for m in g.members if not m.bot])
-        dBotPayload = {"guilds": len(bot.guilds), "users": totalUsers}
 
-        resp = await session.post(discordBots, data=dBotPayload)
-        if resp.status == 200:
-            log.spam("Updated DiscordBotList.com")
-        else:
-            log.error(
-                f"Failed to update DiscordBotList.com: {resp.status}: {resp.reason}"
-            )
-            if resp.status == 401:
-                log.warning("Disabling bot list updates for this session")
-                bot.shouldUpdateBL = False
+@bot.event
+async def on_shard_resumed(shard_id):
+    log.debug(f"Shard {shard_id} resumed")
 
 
 @bot.event
 async def on_ready():
     """Called when the bot is ready"""
     if not bot.startTime:
+        bot.readyAt = perf_counter()
         await startupTasks()
     log.info("INFO".center(40, "-"))
     log.info(f"Logged in as       : {bot.user.name} #{bot.user.discriminator}")
@@ -107,6 +118,9 @@ async def on_ready():
     log.info(f"Start Time         : {bot.startTime.ctime()}")
     log.info(f"DB Connection Type : {'Tunneled' if bot.db.tunnel else 'Direct'}")
     log.info(f"Server Count       : {len(bot.guilds)}")
+    log.info(f"Shards             : {sorted(bot.shards)} of {bot.shard_count}")
+    log.info(f"Cluster            : {bot.cluster.clusterID + 1} of {bot.cluster.clusterCount}")
+    log.info(f"Member Cache       : {'Off, approximate counts' if bot.lowMemory else 'On'}")
     log.info(f"Cog Count          : {len(bot.cogs)}")
     log.info(f"Command Count      : {len(slash.commands)}")
     log.info(f"Discord.py Version : {discord.__version__}")
@@ -170,19 +184,33 @@ async def on_slash_command_error(ctx, ex):
 @bot.event
 async def on_guild_join(guild: discord.Guild):
     """Called when bot is added to a guild"""
+    if not bot.runsGuild(guild.id):
+        return
     while not bot.is_ready():
         await asyncio.sleep(5)
+    await bot.leases.ready.wait()
+    bot.userCounts.addGuild(guild)
     log.info(
-        f"Joined Guild {guild.id}. {len([m for m in guild.members if not m.bot])} users"
+        f"Joined Guild {guild.id}. {bot.userCounts.counts.get(guild.id, 0)} "
+        f"{'members' if bot.userCounts.approximate else 'users'}"
     )
-    await statsUpdate()
+    bot.stats.request()
     if guild.id == 110373943822540800:
         return
 
+    # every process running this shard counts the guild, only the lease holder sets it up and greets it
+    if not bot.ownsGuild(guild.id):
+        # the lease may be changing hands, give it a renewal to settle
+        await asyncio.sleep(bot.leases.renewInterval)
+        if not bot.ownsGuild(guild.id):
+            return
+
     await bot.db.execute(
-        f"INSERT INTO QOTDBot.guilds SET guildID = '{guild.id}', prefix = '/' "
-        f"ON DUPLICATE KEY UPDATE guildID = '{guild.id}'"
+        "INSERT INTO QOTDBot.guilds SET guildID = %s, prefix = '/' "
+        "ON DUPLICATE KEY UPDATE guildID = %s",
+        (str(guild.id), str(guild.id)),
     )
+    bot.guildConfigs.invalidate(guild.id)
     embed = utilities.defaultEmbed(title="Hello!")
     message = (
         "[intro]\n"
@@ -235,7 +263,9 @@ async def on_guild_join(guild: discord.Guild):
             text="this message was sent here as your server does not have a system channel "
             "and a general channel could not be found"
         )
-        await guild.owner.send(embed=embed)
+        # without the member cache the owner is only known by id
+        owner = guild.owner or await bot.fetch_user(guild.owner_id)
+        await owner.send(embed=embed)
         return log.debug("Sent greeting in owner dm")
 
     except Exception as e:
@@ -252,31 +282,40 @@ async def on_guild_remove(guild):
     log.info(f"Left Guild {guild.id}| Purging data...")
     try:
         await bot.db.execute(
-            f"DELETE FROM QOTDBot.questionLog WHERE guildID = '{guild.id}'"
+            "DELETE FROM QOTDBot.questionLog WHERE guildID = %s", (str(guild.id),)
+        )
+        await bot.db.execute(
+            "DELETE FROM QOTDBot.questions WHERE guildID = %s", (str(guild.id),)
         )
         await bot.db.execute(
-            f"DELETE FROM QOTDBot.questions WHERE guildID = '{guild.id}'"
+            "DELETE FROM QOTDBot.guilds WHERE guildID = %s", (str(guild.id),)
         )
-        await bot.db.execute(f"DELETE FROM QOTDBot.guilds WHERE guildID = '{guild.id}'")
+        qotd = bot.get_cog("QOTD")
+        if qotd is not None:
+            await qotd.decks.drop(guild.id)
+        bot.guildConfigs.invalidate(guild.id)
         log.spam(f"{guild.id}:: Data Purged")
     except Exception as e:
         log.critical(f"FAILED TO PURGE DATA FOR {guild.id}: {e}")
-    asyncio.create_task(statsUpdate())
+    bot.userCounts.removeGuild(guild)
+    bot.stats.request()
 
 
 @bot.event
 async def on_member_join(member):
+    bot.userCounts.memberJoined(member)
     if member.guild.id == 110373943822540800:
         return
     if not member.bot:
         log.spam("Member added event")
-        asyncio.create_task(statsUpdate())
+        bot.stats.request()
 
 
 @bot.event
 async def on_member_remove(member):
+    bot.userCounts.memberLeft(member)
     if member.guild.id == 110373943822540800:
         return
     if not member.bot:
         log.spam("Member removed event")
-        asyncio.create_task(statsUpdate())
+        bot.stats.request()
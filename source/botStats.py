@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from time import monotonic
+
+import aiohttp
+import discord
+from discord.ext import tasks
+from discord.http import Route
+
+from . import utilities
+
+log = utilities.getLog("botStats", logging.INFO)
+
+
+class UserCounter:
+    """How many humans are in each guild, kept up to date from member and guild events
+
+    A guild's members are only counted when it is first seen, after that each join or leave is O(1).
+    Without the member cache there are no members to count, or member events, so each guild's member count
+    from discord is used instead. That includes bots, and is refreshed hourly from the approximate counts"""
+
+    def __init__(self, bot=None, approximate: bool = False):
+        self.bot = bot
+        self.approximate = approximate
+        """Are these discord's member counts, rather than counted humans"""
+
+        self.counts: dict = {}
+        """guild id -> human members"""
+
+        self.total = 0
+
+        self.pageSize = 200
+        """How many guilds' approximate counts are fetched per request, 200 is the most discord allows"""
+        self.refreshTask = tasks.loop(hours=1)(self._refresh)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def addGuild(self, guild: discord.Guild):
+        self.removeGuild(guild)
+        if self.approximate:
+            count = guild.member_count or 0
+        else:
+            count = sum(1 for m in guild.members if not m.bot)
+        self.counts[guild.id] = count
+        self.total += count
+
+    def removeGuild(self, guild: discord.Guild):
+        self.total -= self.counts.pop(guild.id, 0)
+
+    def loadAll(self, guilds):
+        self.counts.clear()
+        self.total = 0
+        for guild in guilds:
+            self.addGuild(guild)
+
+    async def _refresh(self):
+        if self.refreshTask.current_loop == 0:
+            # loadAll has only just counted them
+            return
+        try:
+            await self.fetchApproximate()
+        except Exception as e:
+            log.error(f"Failed to fetch approximate member counts: {e}")
+
+    async def fetchApproximate(self):
+        """Updates every guild's count from discord's approximate member counts, a page of guilds per request"""
+        after = None
+        updated = 0
+        while True:
+            params = {"limit": self.pageSize, "with_counts": "true"}
+            if after:
+                params["after"] = after
+            page = await self.bot.http.request(Route("GET", "/users/@me/guilds"), params=params)
+            for data in page:
+                guildID = int(data["id"])
+                count = data.get("approximate_member_count")
+                if guildID in self.counts and count is not None:
+                    self.total += count - self.counts[guildID]
+                    self.counts[guildID] = count
+                    updated += 1
+            if len(page) < self.pageSize:
+                break
+            after = page[-1]["id"]
+            await asyncio.sleep(1)
+        log.debug(f"Refreshed approximate member counts for {updated} guilds")
+
+    def memberJoined(self, member: discord.Member):
+        if not member.bot and member.guild.id in self.counts:
+            self.counts[member.guild.id] += 1
+            self.total += 1
+
+    def memberLeft(self, member: discord.Member):
+        if not member.bot and self.counts.get(member.guild.id, 0) > 0:
+            self.counts[member.guild.id] -= 1
+            self.total -= 1
+
+
+class StatsPublisher:
+    """Posts the bot's guild and user counts to DiscordBotList.com
+
+    Updates are debounced, however many are requested at most one post is made per window, and every
+    post goes over the same session"""
+
+    def __init__(self, bot, window: float = 300):
+        self.bot = bot
+        self.window = window
+        """The least time, in seconds, between posts"""
+
+        self.enabled = True
+        self._session: aiohttp.ClientSession = None
+        self._pending: asyncio.Task = None
+        self._lastPost = float("-inf")
+
+    def request(self):
+        """Asks for the stats to be posted, this returns immediately"""
+        if not self.enabled or (self._pending and not self._pending.done()):
+            return
+        delay = max(0.0, self._lastPost + self.window - monotonic())
+        self._pending = asyncio.create_task(self._publishAfter(delay))
+
+    async def _publishAfter(self, delay: float):
+        await asyncio.sleep(delay)
+        self._lastPost = monotonic()
+        try:
+            await self.publish()
+        except Exception as e:
+            log.error(f"Failed to update DiscordBotList.com: {e}")
+
+    async def publish(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"Authorization": utilities.getDiscordBotsToken()}
+            )
+        guilds, users = len(self.bot.guilds), self.bot.userCounts.total
+        if self.bot.cluster.clustered:
+            if self.bot.cluster.clusterID != 0:
+                # the first cluster posts the totals for all of them
+                return
+            guilds, users = await self.bot.cluster.totals()
+
+        url = f"https://discordbotlist.com/api/v1/bots/{self.bot.user.id}/stats"
+        payload = {"guilds": guilds, "users": users}
+
+        async with self._session.post(url, data=payload) as resp:
+            if resp.status == 200:
+                log.spam("Updated DiscordBotList.com")
+            else:
+                log.error(
+                    f"Failed to update DiscordBotList.com: {resp.status}: {resp.reason}"
+                )
+                if resp.status == 401:
+                    log.warning("Disabling bot list updates for this session")
+                    self.enabled = False
+
+    async def close(self):
+        if self._pending:
+            self._pending.cancel()
+        if self._session is not None:
+            await self._session.close()
@@ -82,21 +82,16 @@ def userHasPerms(ctx: SlashContext) -> bool:
 
 
 async def checkGuildIsSetup(ctx) -> bool:
-    """Makes sure all the basic information is set"""
-    try:
-        guildData = await ctx.bot.db.execute(
-            f"SELECT * FROM QOTDBot.guilds WHERE guildID = '{ctx.guild.id}'",
-            getOne=True
-        )
-        if guildData['qotdChannel'] is None or \
-                guildData['timeZone'] is None or \
-                guildData['sendTime'] is None:
-            return False
-        return True
-    except TypeError:
+    """Makes sure all the basic information is set
+    If the guild can't be read this raises, rather than telling a set up guild it isn't"""
+    guildData = await ctx.bot.guildConfigs.get(ctx.guild.id, raiseErrors=True)
+    if guildData is None:
         log.warning(f"{ctx.guild.id}:: Not present in guild table, creating entry")
         await ctx.bot.db.execute(
-            f"INSERT INTO QOTDBot.guilds SET guildID = '{ctx.guild.id}', prefix = '/' "
-            f"ON DUPLICATE KEY UPDATE guildID = '{ctx.guild.id}'"
+            "INSERT INTO QOTDBot.guilds SET guildID = %s, prefix = '/' "
+            "ON DUPLICATE KEY UPDATE guildID = %s",
+            (str(ctx.guild.id), str(ctx.guild.id))
         )
+        ctx.bot.guildConfigs.invalidate(ctx.guild.id)
         return False
+    return guildData.isSetup
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+from time import monotonic, time
+
+import aiohttp
+import redis.asyncio as aioredis
+
+from . import utilities
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+log = utilities.getLog("cluster", logging.INFO)
+
+# Each cluster is one bot process running a contiguous range of shards. The launcher starts and restarts them,
+# and every cluster writes its status to redis at qotd:cluster:<cluster id> so any of them can report on the rest
+
+_statusKey = "qotd:cluster:{}"
+
+statusTTL = 90
+"""How long, in seconds, a cluster's status is kept without being refreshed. After this it is reported as down"""
+
+
+class ClusterStatus:
+    """Publishes this process's status to redis, and reads every cluster's"""
+
+    def __init__(self, bot, interval: float = 30, host: str = "localhost", port: int = 6379, db: int = 1):
+        self.bot = bot
+        self.clusterID, self.clusterCount = utilities.getClusterConfig()
+        self.interval = interval
+        """How often, in seconds, our status is published"""
+
+        self.redis = aioredis.Redis(host=host, port=port, db=db, max_connections=2)
+        self._task: asyncio.Task = None
+
+    @property
+    def clustered(self) -> bool:
+        """Is this process one of several"""
+        return self.clusterCount > 1
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._publishLoop())
+
+    async def _publishLoop(self):
+        while True:
+            try:
+                await self.publish()
+            except Exception as e:
+                log.error(f"Failed to publish cluster status: {e}")
+            if self.clustered and self.clusterID == 0:
+                # the first cluster posts everyone's stats, so it needs to see everyone's changes
+                self.bot.stats.request()
+            await asyncio.sleep(self.interval)
+
+    def snapshot(self) -> dict:
+        """This process's status"""
+        bot = self.bot
+        qotd = bot.get_cog("QOTD")
+        polls = bot.get_cog("Polls")
+        memory = None
+        if resource is not None:
+            # kilobytes on linux
+            memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+        return {
+            "id": self.clusterID,
+            "pid": os.getpid(),
+            "shards": sorted(bot.shards),
+            "guilds": len(bot.guilds),
+            "users": bot.userCounts.total,
+            "latency": bot.latency * 1000 if bot.shards else None,
+            "started": bot.startTime.timestamp() if bot.startTime else None,
+            "scheduled": len(qotd.dispatcher) if hasattr(qotd, "dispatcher") else None,
+            "leases": len(bot.leases),
+            "polls": len(polls.store.active) if hasattr(polls, "store") else None,
+            "memory": memory,
+            "updated": time(),
+        }
+
+    async def publish(self):
+        await self.redis.set(_statusKey.format(self.clusterID), json.dumps(self.snapshot()), ex=statusTTL)
+
+    async def gather(self) -> list:
+        """Every cluster's last status, in cluster order. Clusters that haven't reported recently are None"""
+        keys = [_statusKey.format(i) for i in range(self.clusterCount)]
+        return [json.loads(raw) if raw else None for raw in await self.redis.mget(keys)]
+
+    async def totals(self) -> (int, int):
+        """:return: (guilds, users) across every live cluster"""
+        statuses = [s for s in await self.gather() if s]
+        return sum(s["guilds"] for s in statuses), sum(s["users"] for s in statuses)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        try:
+            await self.redis.delete(_statusKey.format(self.clusterID))
+        except Exception:
+            pass
+        await self.redis.close()
+
+
+def splitShards(shardCount: int, clusters: int) -> list:
+    """
+    Splits shards into contiguous ranges, as evenly as possible
+    :return: a list of (first shard, last shard) for each cluster
+    """
+    size, extra = divmod(shardCount, clusters)
+    ranges = []
+    first = 0
+    for i in range(clusters):
+        last = first + size + (1 if i < extra else 0) - 1
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+async def getGatewayInfo(token: str) -> (int, int):
+    """
+    Asks discord how many shards we should run
+    :return: (recommended shard count, how many shards can identify at once)
+    """
+    async with aiohttp.ClientSession(headers={"Authorization": f"Bot {token}"}) as session:
+        async with session.get("https://discord.com/api/v9/gateway/bot") as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+    return data["shards"], data["session_start_limit"]["max_concurrency"]
+
+
+class Worker:
+    """A cluster process, and how it has been getting on"""
+
+    def __init__(self, clusterID: int, shards: tuple, env: dict):
+        self.clusterID = clusterID
+        self.shards = shards
+        self.env = env
+        self.process: asyncio.subprocess.Process = None
+        self.startedAt = 0.0
+        self.restarts = 0
+
+
+class ClusterLauncher:
+    """Runs the bot as several processes, each with its own event loop and range of shards
+
+    Every worker is main.py with its shards, cluster id, and a share of the database and redis connections
+    set in its environment. Workers that crash are restarted, backing off if they keep crashing"""
+
+    def __init__(
+        self,
+        clusters: int = None,
+        shardCount: int = None,
+        dbConnections: int = 40,
+        redisConnections: int = 128,
+        entryPoint: str = "main.py",
+    ):
+        self.clusters = clusters
+        """How many processes to run, defaults to one per cpu core"""
+        self.shardCount = shardCount
+        """Defaults to discord's recommendation"""
+        self.dbConnections = dbConnections
+        self.redisConnections = redisConnections
+        """The connections every cluster can hold between them"""
+        self.entryPoint = entryPoint
+
+        self.workers: list = []
+        self.stopping = False
+
+        self.stableAfter = 300
+        """A worker that ran this long, in seconds, before exiting is restarted straight away"""
+        self.maxBackoff = 300
+
+    async def run(self):
+        concurrency = 1
+        if self.shardCount is None:
+            self.shardCount, concurrency = await getGatewayInfo(utilities.getToken())
+        clusters = max(1, min(self.clusters or os.cpu_count() or 1, self.shardCount))
+
+        ranges = splitShards(self.shardCount, clusters)
+        log.info(f"Running {self.shardCount} shards over {clusters} clusters")
+        for clusterID, shards in enumerate(ranges):
+            env = dict(
+                os.environ,
+                QOTD_CLUSTER_ID=str(clusterID),
+                QOTD_CLUSTER_COUNT=str(clusters),
+                QOTD_SHARD_COUNT=str(self.shardCount),
+                QOTD_SHARD_IDS=f"{shards[0]}-{shards[1]}",
+                QOTD_DB_POOL=str(max(2, self.dbConnections // clusters)),
+                QOTD_REDIS_POOL=str(max(4, self.redisConnections // clusters)),
+            )
+            self.workers.append(Worker(clusterID, shards, env))
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:
+                pass
+
+        supervisors = []
+        for worker in self.workers:
+            if self.stopping:
+                break
+            supervisors.append(asyncio.create_task(self.supervise(worker)))
+            # discord only lets `concurrency` shards identify every 5 seconds, so let each cluster connect
+            # before starting the next
+            await asyncio.sleep(5 * (worker.shards[1] - worker.shards[0] + 1) / concurrency)
+        await asyncio.gather(*supervisors)
+        log.info("Every cluster has stopped")
+
+    async def supervise(self, worker: Worker):
+        """Runs a worker, restarting it whenever it crashes"""
+        backoff = 5
+        while not self.stopping:
+            worker.process = await asyncio.create_subprocess_exec(
+                sys.executable, self.entryPoint, env=worker.env
+            )
+            worker.startedAt = monotonic()
+            log.info(
+                f"Started cluster {worker.clusterID} (pid {worker.process.pid}), "
+                f"shards {worker.shards[0]}-{worker.shards[1]}"
+            )
+            code = await worker.process.wait()
+            if self.stopping:
+                break
+            if code == 0:
+                # the owner shut it down
+                log.warning(f"Cluster {worker.clusterID} exited cleanly, not restarting it")
+                break
+
+            if monotonic() - worker.startedAt > self.stableAfter:
+                backoff = 5
+            else:
+                backoff = min(backoff * 2, self.maxBackoff)
+            worker.restarts += 1
+            log.error(f"Cluster {worker.clusterID} exited with code {code}, restarting in {backoff}s")
+            await asyncio.sleep(backoff)
+
+    def stop(self):
+        """Asks every worker to shut down, they close the same way they would for ctrl+c"""
+        if self.stopping:
+            return
+        log.warning("Stopping every cluster")
+        self.stopping = True
+        for worker in self.workers:
+            if worker.process and worker.process.returncode is None:
+                worker.process.terminate()
+
+
+def launch():
+    # ask for anything missing now, rather than in every worker at once
+    utilities.getToken()
+    utilities.getDiscordBotsToken()
+    from . import databaseManager  # noqa: F401
+
+    clusters = os.environ.get("QOTD_CLUSTERS")
+    shardCount = os.environ.get("QOTD_SHARD_COUNT")
+    launcher = ClusterLauncher(
+        clusters=int(clusters) if clusters else None,
+        shardCount=int(shardCount) if shardCount else None,
+    )
+    asyncio.run(launcher.run())
@@ -184,8 +184,17 @@ class Base(commands.Cog):
             # get qotd cog's data
             scheduledTasks = "Error, could not determine"
             cog = self.bot.get_cog("QOTD")
-            if hasattr(cog, "scheduler"):
-                scheduledTasks = len(cog.scheduler.get_jobs())
+            lastSlot = "None yet"
+            prefetched = "Error, could not determine"
+            if hasattr(cog, "dispatcher"):
+                scheduledTasks = len(cog.dispatcher)
+                if cog.dispatcher.lastReport:
+                    lastSlot = str(cog.dispatcher.lastReport)
+                prefetched = (
+                    f"{len(cog.prefetched)} ready, {cog.prefetched.hits} hits, {cog.prefetched.misses} misses"
+                )
+
+            validationOverhead, queryTime = self.bot.db.overhead()
 
             # get uptime and human format it
             uptime = datetime.now() - self.bot.startTime
@@ -206,20 +215,59 @@ class Base(commands.Cog):
                 f"Uptime             : '{days}{round(hours):02}:{round(minutes):02}:{round(seconds):02}'",
                 f"DB Connection Type : '{'Tunneled' if self.bot.db.tunnel else 'Direct'}'",
                 f"DB Operations      : '{self.bot.db.operations}'",
+                f"DB Query Time      : '{queryTime:.2f}ms avg'",
+                f"DB Ping Overhead   : '{validationOverhead:.2f}ms avg ({self.bot.db.pings} pings, "
+                f"{self.bot.db.reconnects} reconnects)'",
                 f"Stored Questions   : '{totalQuestions['COUNT(*)']}'",
                 f"Question Log Size  : '{totalLog['COUNT(*)']}'",
                 f"Scheduled Tasks    : '{scheduledTasks}'",
+                f"Last QOTD Slot     : '{lastSlot}'",
+                f"Prefetched Posts   : '{prefetched}'",
+                f"Shard Leases       : '{len(self.bot.leases)}/{len(self.bot.leases.shards)} held'",
                 f"Server Count       : '{len(self.bot.guilds)}'",
+                f"User Count         : '{self.bot.userCounts.total}"
+                f"{' (approximate, member cache off)' if self.bot.userCounts.approximate else ''}'",
                 f"Setup Servers      : '{setupGuilds}'",
+                f"Config Cache       : '{len(self.bot.guildConfigs)} guilds, "
+                f"{self.bot.guildConfigs.hits} hits, {self.bot.guildConfigs.misses} misses'",
                 f"Cog Count          : '{len(self.bot.cogs)}'",
                 f"Command Count      : '{len(self.slash.commands)}'",
                 f"Discord.py Version : '{discord.__version__}'",
                 "```"
             ]
+            if self.bot.cluster.clustered:
+                message[-1:-1] = await self.clusterStatus()
             message.insert(1, "BOT INFO".center(len(max(message, key=len)), "-"))
             message.insert(len(message) - 1, "END BOT INFO".center(len(max(message, key=len)), "-"))
             await ctx.send("\n".join(message))
 
+    async def clusterStatus(self) -> list:
+        """A line for each cluster, and their totals"""
+        lines = [f"Answered By        : 'Cluster {self.bot.cluster.clusterID}'"]
+        guilds = users = polls = 0
+        for clusterID, status in enumerate(await self.bot.cluster.gather()):
+            if status is None:
+                lines.append(f"Cluster {clusterID:<10} : 'DOWN'")
+                continue
+            guilds += status["guilds"]
+            users += status["users"]
+            polls += status["polls"] or 0
+            shards = f"{status['shards'][0]}-{status['shards'][-1]}" if status["shards"] else "none"
+            latency = f"{status['latency']:.0f}ms" if status["latency"] is not None else "?"
+            uptime = ""
+            if status["started"]:
+                hours, remainder = divmod(status["updated"] - status["started"], 3600)
+                uptime = f", up {int(hours)}:{int(remainder // 60):02}"
+            memory = f", {status['memory']}MB" if status["memory"] else ""
+            lines.append(
+                f"Cluster {clusterID:<10} : 'shards {shards}, {status['guilds']} servers, {status['users']} users, "
+                f"{status['scheduled']} scheduled, {status.get('leases', 0)} leases, {latency}{memory}{uptime}'"
+            )
+        lines.append(f"All Servers        : '{guilds}'")
+        lines.append(f"All Users          : '{users}'")
+        lines.append(f"All Active Polls   : '{polls}'")
+        return lines
+
 
 def setup(bot):
     """Called when this cog is mounted"""
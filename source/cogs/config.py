@@ -69,8 +69,9 @@ class Config(commands.Cog):
                 embed.description = f"Setup Failed, use `/setup simple` to try again"
                 await msg.edit(embed=embed)
             await self.bot.db.execute(
-                f"UPDATE QOTDBot.guilds SET qotdChannel='{result.id}' "
-                f"WHERE guildID = '{ctx.guild.id}'")
+                "UPDATE QOTDBot.guilds SET qotdChannel=%s WHERE guildID = %s",
+                (str(result.id), str(ctx.guild.id)))
+            self.bot.guildConfigs.update(ctx.guild.id, qotdChannel=result.id)
             embed.colour = discord.Colour.green()
             embed.description = f"Set QOTD Channel to {result.mention}"
             await msg.edit(embed=embed)
@@ -107,8 +108,9 @@ class Config(commands.Cog):
             if result:
                 # if it is correct, push to db, and return
                 await self.bot.db.execute(
-                    f"UPDATE QOTDBot.guilds SET timeZone='{possibleTimezone}' "
-                    f"WHERE guildID = '{ctx.guild.id}'")
+                    "UPDATE QOTDBot.guilds SET timeZone=%s WHERE guildID = %s",
+                    (possibleTimezone, str(ctx.guild.id)))
+                self.bot.guildConfigs.update(ctx.guild.id, timeZone=possibleTimezone)
                 embed.colour = discord.Colour.green()
                 embed.description = f"Your timezone has been set to **{possibleTimezone}**"
                 await msg.edit(embed=embed)
@@ -137,8 +139,9 @@ class Config(commands.Cog):
             if 0 <= hour <= 23:
                 # valid time
                 await self.bot.db.execute(
-                    f"UPDATE QOTDBot.guilds SET sendTime={hour} "
-                    f"WHERE guildID = '{ctx.guild.id}'")
+                    "UPDATE QOTDBot.guilds SET sendTime=%s WHERE guildID = %s",
+                    (hour, str(ctx.guild.id)))
+                self.bot.guildConfigs.update(ctx.guild.id, sendTime=hour)
                 _emb.colour = discord.Colour.green()
                 _emb.description = f"Your questions will be sent at **{hour:02}:00**"
                 await msg.edit(embed=_emb)
@@ -155,8 +158,9 @@ class Config(commands.Cog):
         # endregion: time
 
         await self.bot.db.execute(
-            f"UPDATE QOTDBot.guilds SET enabled=TRUE "
-            f"WHERE guildID = '{ctx.guild.id}'")
+            "UPDATE QOTDBot.guilds SET enabled=TRUE WHERE guildID = %s",
+            (str(ctx.guild.id),))
+        self.bot.guildConfigs.update(ctx.guild.id, enabled=True)
 
         _emb.colour = discord.Colour.gold()
         _emb.title = "🎉🥳🎉 **Setup Complete** 🎉🥳🎉"
@@ -174,14 +178,16 @@ class Config(commands.Cog):
         state = True if state == "True" else False
         if state:
             await self.bot.db.execute(
-                f"UPDATE QOTDBot.guilds SET enabled=TRUE "
-                f"WHERE guildID = '{ctx.guild.id}'")
+                "UPDATE QOTDBot.guilds SET enabled=TRUE WHERE guildID = %s",
+                (str(ctx.guild.id),))
+            self.bot.guildConfigs.update(ctx.guild.id, enabled=True)
             await ctx.send("QOTD has been enabled")
             log.debug(f"{ctx.guild.id} enabled QOTD")
         else:
             await self.bot.db.execute(
-                f"UPDATE QOTDBot.guilds SET enabled=FALSE "
-                f"WHERE guildID = '{ctx.guild.id}'")
+                "UPDATE QOTDBot.guilds SET enabled=FALSE WHERE guildID = %s",
+                (str(ctx.guild.id),))
+            self.bot.guildConfigs.update(ctx.guild.id, enabled=False)
             await ctx.send("QOTD has been disabled")
             log.debug(f"{ctx.guild.id} disabled QOTD")
 
@@ -197,8 +203,9 @@ class Config(commands.Cog):
             return await ctx.send("Only hours 0-24 are accepted")
 
         await self.bot.db.execute(
-            f"UPDATE QOTDBot.guilds SET sendTime={hour} "
-            f"WHERE guildID = '{ctx.guild.id}'")
+            "UPDATE QOTDBot.guilds SET sendTime=%s WHERE guildID = %s",
+            (hour, str(ctx.guild.id)))
+        self.bot.guildConfigs.update(ctx.guild.id, sendTime=hour)
         _emb = utilities.defaultEmbed(title="Set Time", colour=discord.Colour.green())
         _emb.description = f"Your questions will be sent at **{hour:02}:00**"
         await ctx.send(embed=_emb)
@@ -236,8 +243,9 @@ class Config(commands.Cog):
         if result:
             # if it is correct, upload to db, and return
             await self.bot.db.execute(
-                f"UPDATE QOTDBot.guilds SET timeZone='{mostSimilar[0]}' "
-                f"WHERE guildID = '{ctx.guild.id}'")
+                "UPDATE QOTDBot.guilds SET timeZone=%s WHERE guildID = %s",
+                (mostSimilar[0], str(ctx.guild.id)))
+            self.bot.guildConfigs.update(ctx.guild.id, timeZone=mostSimilar[0])
             _emb.colour = discord.Colour.green()
             _emb.description = f"Your timezone has been set to **{mostSimilar[0]}**"
             await msg.edit(embed=_emb)
@@ -262,8 +270,9 @@ class Config(commands.Cog):
                 return await ctx.send("Sorry, I am missing permissions in that channel.\n"
                                       "I need send messages, add reactions, manage messages, and embed links")
             await self.bot.db.execute(
-                f"UPDATE QOTDBot.guilds SET qotdChannel='{channel.id}' "
-                f"WHERE guildID = '{ctx.guild.id}'")
+                "UPDATE QOTDBot.guilds SET qotdChannel=%s WHERE guildID = %s",
+                (str(channel.id), str(ctx.guild.id)))
+            self.bot.guildConfigs.update(ctx.guild.id, qotdChannel=channel.id)
             _emb.colour = discord.Colour.green()
             _emb.description = f"Set QOTD Channel to {channel.mention}"
             await ctx.send(embed=_emb)
@@ -292,8 +301,10 @@ class Config(commands.Cog):
             if isinstance(role, discord.Role):
                 if role.mentionable:
                     await self.bot.db.execute(
-                        f"UPDATE QOTDBot.guilds SET mentionRole = '{role.id}' WHERE guildID = '{ctx.guild.id}'"
+                        "UPDATE QOTDBot.guilds SET mentionRole = %s WHERE guildID = %s",
+                        (str(role.id), str(ctx.guild.id))
                     )
+                    self.bot.guildConfigs.update(ctx.guild.id, mentionRole=role.id)
                     return await ctx.send(f"Got it, i'll mention {role.mention} whenever a QOTD is posted",
                                           allowed_mentions=discord.AllowedMentions.none())
                 else:
@@ -302,8 +313,10 @@ class Config(commands.Cog):
                 return ctx.send("You did not choose a role to mention")
         else:
             await self.bot.db.execute(
-                f"UPDATE QOTDBot.guilds SET mentionRole = NULL WHERE guildID = '{ctx.guild.id}'"
+                "UPDATE QOTDBot.guilds SET mentionRole = NULL WHERE guildID = %s",
+                (str(ctx.guild.id),)
             )
+            self.bot.guildConfigs.update(ctx.guild.id, mentionRole=None)
             return await ctx.send("Got it, i wont mention anybody when i post")
 
     @commands.check(checks.checkAll)
@@ -317,7 +330,9 @@ class Config(commands.Cog):
         else:
             await ctx.send("Okay, no pinning")
         await self.bot.db.execute(
-            f"UPDATE QOTDBot.guilds SET pinMessage = {option} WHERE guildID = '{ctx.guild.id}'")
+            "UPDATE QOTDBot.guilds SET pinMessage = %s WHERE guildID = %s",
+            (option, str(ctx.guild.id)))
+        self.bot.guildConfigs.update(ctx.guild.id, pinMessage=option)
 
 
 def setup(bot):
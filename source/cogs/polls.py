@@ -1,58 +1,25 @@
 import asyncio
+import heapq
 import json
 import os
 import sys
-import typing
 from copy import copy
 from datetime import datetime, timedelta
+from time import monotonic, time
 
-import redis
-import jsonpickle
 import discord
 import discord_slash.error
 from discord.ext import commands, tasks
 from discord_slash import cog_ext, SlashContext, ComponentContext
 from discord_slash.utils import manage_components, manage_commands
 
-from source import utilities, checks, jsonManager
+from source import utilities, checks, jsonManager, pollStore, pollArchive
+from source.dispatcher import RateLimiter
+from source.pollData import PollData, Option  # polls pickled before the store existed refer to these here
 
 log = utilities.getLog("Cog::polls")
 
 
-class PollData:
-    """Represents a poll"""
-
-    def __init__(
-        self,
-        author_id,
-        title="",
-        poll_options=None,
-        expiry_time=None,
-        single_vote=False,
-    ):
-        if poll_options is None:
-            poll_options = []
-        self.title = title
-        self.options: typing.List[Option] = poll_options
-        self.expiry_time: datetime = expiry_time
-        self.single_vote: bool = single_vote
-
-        self.channel_id: int = 0
-        self.author_id: int = author_id
-        self.message_id: int = 0
-
-
-class Option:
-    """Represents a poll option"""
-
-    def __init__(self, option_text="Unset", emoji="❓"):
-        super().__init__()
-        self.text = option_text
-        self.emoji = emoji
-        self.voters: typing.List[int] = []
-        self.style: int = 1
-
-
 class Polls(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -61,10 +28,31 @@ class Polls(commands.Cog):
         self.booleanEmoji = ["✔", "✖"]
         self.bothEmoji = self.emoji + self.booleanEmoji
         self.pollsToUpdate = set()
+        """Message ids of polls that have been voted on since their message was last edited"""
+        self.pollMessages = {}
+        """Message id -> the poll's message, for polls waiting to be edited"""
+        self.lastPollUpdate = {}
+        """Message id -> when its message was last edited"""
+        self.updateInterval = 3
+        """The least time, in seconds, between edits to the same poll"""
+        self.editLimiter = RateLimiter(5)
+        """Paces edits across every poll"""
+        self.expiryHeap = []
+        """(unix timestamp, message id) of polls about to close, soonest first"""
+        self.expiryWake = asyncio.Event()
+        self.expiryResync = 60
+        """The longest closePollsTask sleeps for, so it sees polls created by other processes"""
         self.bot.add_listener(self.on_component, "on_component")
         self.bot.add_listener(self.reactionProcessor, "on_raw_reaction_add")
-        self.polls = {}
-        self.redis = redis.Redis(host="localhost", port=6379, db=1)
+        self.store = pollStore.PollStore()
+        self.archive = pollArchive.PollArchive(bot.db)
+        """The results of closed polls"""
+        self.markedClosed = set()
+        """Message ids of polls already shown as closed, that are still waiting to be archived"""
+        self.sweepLimiter = RateLimiter(1)
+        """Paces the sweeper's message checks"""
+        self.polls = self.store.cache
+        """Live polls, kept in memory by the store"""
 
         # add pollGen commands
         prefab = jsonManager.getDecorator("pollPrefab")
@@ -79,51 +67,87 @@ class Polls(commands.Cog):
 
     async def setup(self):
         log.info("Starting poll tasks...")
-        self.closePollsTask.start()
         try:
-            self.redis.ping()
+            await self.store.ping()
+            await self.store.indexExpiries()
+            await self.store.loadIndex()
+            await self.archive.setup()
+            await self.store.start()
         except Exception as e:
             log.critical(e)
             exit(1)
+        self.bot.leases.addListener(self.on_leases_changed)
+        self.closePollsTask.start()
+        self.updatePollsTask.start()
+        self.sweepPollsTask.start()
 
-    async def on_component(self, ctx: ComponentContext):
-        await ctx.defer(edit_origin=True)
-
-        poll: typing.Optional[PollData] = await self.get_poll(ctx.origin_message_id)
-        if poll:
-            old_embed = ctx.origin_message.embeds[0]
-            new_embed = utilities.defaultEmbed(title=old_embed.title)
-            new_embed.set_footer(
-                text=old_embed.footer.text, icon_url=old_embed.footer.icon_url
-            )
-            option_id = int(ctx.custom_id.split("|")[-1])
+    async def shutdown(self):
+        """Writes any changed polls before the bot disconnects"""
+        await self.store.close()
 
-            option: Option = poll.options[option_id]
-            if ctx.author.id not in option.voters:
-                option.voters.append(ctx.author.id)
-            else:
-                option.voters.remove(ctx.author.id)
+    async def on_leases_changed(self, gained: set, lost: set):
+        """We've taken over shards, close any of their polls that are overdue"""
+        if gained:
+            self.expiryWake.set()
 
-            total_votes = 0
-            for _option in poll.options:
-                if poll.single_vote:
-                    if _option != option:
-                        if ctx.author.id in _option.voters:
-                            _option.voters.remove(ctx.author.id)
-                total_votes += len(_option.voters)
+    async def on_component(self, ctx: ComponentContext):
+        # acknowledge straight away, the message itself is updated by updatePollsTask
+        await ctx.defer(edit_origin=True)
 
-            for _option in poll.options:
-                new_embed.add_field(
-                    name=f"{_option.emoji} {_option.text}",
-                    value=self.create_bar(len(_option.voters), total_votes),
-                    inline=False,
-                )
-            await asyncio.to_thread(
-                self.redis.set, ctx.origin_message_id, jsonpickle.encode(poll)
+        option_id = int(ctx.custom_id.split("|")[-1])
+        # the vote is made, and counted, in one step on redis. If it isn't a poll we get nothing back
+        counts = await self.store.vote(ctx.origin_message_id, ctx.author.id, option_id)
+        if counts and ctx.origin_message:
+            self.pollMessages[ctx.origin_message_id] = ctx.origin_message
+            self.pollsToUpdate.add(ctx.origin_message_id)
+
+    def render_counts(self, old_embed: discord.Embed, counts: list) -> discord.Embed:
+        """Redraws a poll's embed with new vote counts
+        The option names are already on the message, so the poll itself doesn't need reading"""
+        new_embed = utilities.defaultEmbed(title=old_embed.title)
+        new_embed.set_footer(
+            text=old_embed.footer.text, icon_url=old_embed.footer.icon_url
+        )
+        total_votes = sum(counts)
+        for field, count in zip(old_embed.fields, counts):
+            new_embed.add_field(
+                name=field.name,
+                value=self.create_bar(count, total_votes),
+                inline=False,
             )
-            new_embed.description = f"{total_votes} vote{'s' if total_votes > 1 or total_votes == 0 else ''}"
-
-            await ctx.edit_origin(embed=new_embed)
+        new_embed.description = f"{total_votes} vote{'s' if total_votes > 1 or total_votes == 0 else ''}"
+        return new_embed
+
+    @tasks.loop(seconds=1)
+    async def updatePollsTask(self):
+        """Edits polls that have been voted on, at most once per updateInterval each"""
+        now = monotonic()
+        ready = [
+            message_id
+            for message_id in self.pollsToUpdate
+            if now - self.lastPollUpdate.get(message_id, 0) >= self.updateInterval
+        ]
+        for message_id in ready:
+            self.pollsToUpdate.discard(message_id)
+            message = self.pollMessages.pop(message_id, None)
+            if message is None or not message.embeds:
+                continue
+            try:
+                counts = await self.store.counts(message_id)
+                if counts is None:
+                    # closed since it was voted on
+                    continue
+                await self.editLimiter.acquire()
+                await message.edit(embed=self.render_counts(message.embeds[0], counts))
+                self.lastPollUpdate[message_id] = monotonic()
+            except Exception as e:
+                log.error(f"Failed to update poll {message_id}: {e}")
+
+        # forget about polls that have gone quiet
+        for message_id in [
+            m for m, t in self.lastPollUpdate.items() if now - t > self.updateInterval * 10
+        ]:
+            del self.lastPollUpdate[message_id]
 
     def create_bar(self, count, total):
         progBarStr = ""
@@ -143,56 +167,195 @@ class Polls(commands.Cog):
 
     async def get_poll(self, message_id: int) -> PollData:
         try:
-            raw_data = await asyncio.to_thread(self.redis.get, message_id)
-            data = jsonpickle.decode(raw_data)
-            if isinstance(data, PollData):
-                return data
-
-            poll = PollData(0)
-            for key in data.keys():
-                if hasattr(poll, key):
-                    poll.__setattr__(key, data.get(key))
-            return poll
+            return await self.store.get(message_id)
         except Exception as e:
             log.error(e)
             return None
 
-    @tasks.loop(seconds=30)
+    @tasks.loop()
     async def closePollsTask(self):
-        """Checks the stored polls to see if they should be closed"""
-        log.spam("Checking poll end times...")
-        keys = await asyncio.to_thread(self.redis.keys, "*")
-        for key in keys:
-            poll = await self.get_poll(key)
-            if poll.expiry_time is not None:
-                if poll.expiry_time < datetime.now():
-                    log.spam(f"Poll needs closing: {poll.message_id}")
-
+        """Sleeps until the next poll is due to close, then closes every poll that is due"""
+        delay = self.expiryResync
+        if self.expiryHeap:
+            delay = min(delay, self.expiryHeap[0][0] - time())
+        if delay > 0:
+            self.expiryWake.clear()
+            try:
+                await asyncio.wait_for(self.expiryWake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+        now = time()
+        while self.expiryHeap and self.expiryHeap[0][0] <= now:
+            heapq.heappop(self.expiryHeap)
+
+        # tasks.loop stops for good on most errors, so nothing is allowed to escape
+        try:
+            await self.close_due_polls(now)
+        except Exception as e:
+            log.error(f"Failed to close due polls: {e}")
+
+    async def close_due_polls(self, now: float):
+        # the index in redis is the source of truth, the heap only decides when to look at it
+        due = await self.store.expired(now)
+        if due:
+            for message_id, poll in zip(due, await self.store.getMany(due)):
+                if poll is None:
+                    # its keys have lapsed, there are no results left to keep
+                    log.warning(f"Unable to read poll {message_id}, removing it from the expiry index")
+                    await self.store.forgetExpiry(message_id)
+                    continue
+                # polls on other shards are closed by whichever process runs them
+                if not self.owns_poll(poll):
+                    continue
+                log.spam(f"Poll needs closing: {poll.message_id}")
+                # polls that aren't archived stay in the index, and are retried on the next pass
+                try:
                     await self.close_poll(poll)
-
-    async def close_poll(self, poll):
+                except Exception as e:
+                    log.error(f"Failed to close poll {message_id}: {e}")
+
+        upcoming = await self.store.nextExpiry(now)
+        # the heap only decides when to wake, if something sooner is already in it we look again then
+        if upcoming and (not self.expiryHeap or upcoming < self.expiryHeap[0]):
+            heapq.heappush(self.expiryHeap, upcoming)
+
+    def scheduleClose(self, poll: PollData):
+        """Wakes closePollsTask for a new poll's expiry, if it is sooner than anything it is waiting for"""
+        if poll.expiry_time:
+            heapq.heappush(self.expiryHeap, (poll.expiry_time.timestamp(), poll.message_id))
+            self.expiryWake.set()
+
+    async def close_poll(self, poll: PollData) -> bool:
+        """Archives a poll's results, and marks its message as closed if it can still be reached
+        :return: False if it couldn't be archived, it is kept in redis to be retried"""
+        counts = await self.store.counts(poll.message_id) or [0] * len(poll.options)
         channel = self.bot.get_channel(int(poll.channel_id))
+        if poll.message_id not in self.markedClosed:
+            try:
+                await self.mark_closed(poll, channel, counts)
+                self.markedClosed.add(poll.message_id)
+            except Exception as e:
+                # the message is gone or out of reach, its results are still worth keeping
+                log.debug(f"Unable to edit closed poll {poll.message_id}: {e}")
+
+        guild = getattr(channel, "guild", None)
+        return await self.retire_poll(poll, counts, guild.id if guild else None)
+
+    async def mark_closed(self, poll: PollData, channel, counts: list):
+        """Redraws a poll's message as closed, with its final counts"""
+        # polls that know their footer can be redrawn without reading the message, so it isn't fetched
+        partial = bool(poll.footer_text)
         message = await self.bot.getMessage(
-            channel=channel, messageID=int(poll.message_id)
+            channel=channel, messageID=int(poll.message_id), partial=partial
         )
         if message:
-            originalEmbed = message.embeds[0]
             embed = discord.Embed(title=f"Closed Poll", colour=discord.Colour(0x727272))
 
             if poll.title:
                 embed.title += f"- {poll.title}"
 
-            footerText = originalEmbed.footer.text
-            embed.set_footer(text=footerText.split("•")[0])
+            if partial:
+                embed.set_footer(text=poll.footer_text.split("•")[0])
+                total_votes = sum(counts)
+                for option, count in zip(poll.options, counts):
+                    embed.add_field(
+                        name=f"{option.emoji} {option.text}",
+                        value=self.create_bar(count, total_votes),
+                        inline=False,
+                    )
+                embed.description = f"{total_votes} vote{'s' if total_votes > 1 or total_votes == 0 else ''}"
+            else:
+                originalEmbed = message.embeds[0]
+                footerText = originalEmbed.footer.text
+                embed.set_footer(text=footerText.split("•")[0])
 
-            for field in originalEmbed.fields:
-                embed.add_field(name=field.name, value=field.value, inline=False)
+                for field in originalEmbed.fields:
+                    embed.add_field(name=field.name, value=field.value, inline=False)
 
-            embed.description = originalEmbed.description
+                embed.description = originalEmbed.description
 
-            await message.edit(embed=embed, components=None)
+            await message.edit(embed=embed, components=[] if partial else None)
 
-            await asyncio.to_thread(self.redis.delete, poll.message_id)
+    def owns_poll(self, poll: PollData) -> bool:
+        """Is this poll in a guild on one of our shards, that we hold the lease for"""
+        if poll.guild_id:
+            return self.bot.ownsGuild(poll.guild_id)
+        # polls from before the guild was stored, we can only see channels in guilds on our shards
+        channel = self.bot.get_channel(int(poll.channel_id))
+        if channel is not None:
+            return self.bot.ownsGuild(channel.guild.id)
+        # nobody can place it, so it is left to whoever holds the first shard
+        return self.bot.shard_ids is None and self.bot.leases.holds(0)
+
+    async def retire_poll(self, poll: PollData, counts: list = None, guild_id: int = None) -> bool:
+        """Archives a poll's results to the database and removes it from redis
+        :return: False if it couldn't be archived, it is kept in redis to be retried"""
+        if counts is None:
+            counts = await self.store.counts(poll.message_id)
+        guild_id = guild_id or poll.guild_id or None
+        try:
+            await self.archive.archive(poll, counts, guild_id)
+        except Exception as e:
+            log.error(f"Failed to archive poll {poll.message_id}, keeping it for now: {e}")
+            return False
+        await self.store.delete(poll.message_id)
+        self.markedClosed.discard(poll.message_id)
+        self.pollsToUpdate.discard(poll.message_id)
+        self.pollMessages.pop(poll.message_id, None)
+        return True
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """Polls whose message has been deleted can never be closed, so they are retired now"""
+        if payload.message_id not in self.store:
+            return
+        poll = await self.get_poll(payload.message_id)
+        if poll:
+            await self.retire_poll(poll, guild_id=payload.guild_id)
+
+    @tasks.loop(hours=1)
+    async def sweepPollsTask(self):
+        """Retires polls whose channel or message no longer exists, and forgets polls that expired in redis"""
+        if self.sweepPollsTask.current_loop == 0:
+            # give the cache a chance to fill before judging what exists
+            return
+        try:
+            retired = await self.sweep_polls()
+        except Exception as e:
+            log.error(f"Failed to sweep polls: {e}")
+            return
+        if retired:
+            log.info(f"Swept {retired} polls whose message no longer exists")
+
+    async def sweep_polls(self) -> int:
+        """:return: how many polls were retired"""
+        message_ids = list(self.store.active)
+        retired = 0
+        for i in range(0, len(message_ids), 100):
+            batch = message_ids[i: i + 100]
+            for message_id, poll in zip(batch, await self.store.getMany(batch)):
+                if poll is None:
+                    # its keys have expired
+                    await self.store.delete(message_id)
+                    continue
+                if not self.owns_poll(poll):
+                    continue
+                channel = self.bot.get_channel(int(poll.channel_id))
+                if channel is not None:
+                    if message_id in self.bot.messageCache:
+                        continue
+                    await self.sweepLimiter.acquire()
+                    try:
+                        await channel.fetch_message(message_id)
+                        continue
+                    except discord.NotFound:
+                        pass
+                    except discord.HTTPException:
+                        # we cant tell, leave it be
+                        continue
+                retired += await self.retire_poll(poll)
+        return retired
 
     async def create_and_post_poll(self, ctx: SlashContext, options: list, **kwargs):
         """Create a poll with the passed kwargs and post it"""
@@ -217,6 +380,7 @@ class Polls(commands.Cog):
                 poll_data.channel_id = kwargs.get("channel").id
             else:
                 poll_data.channel_id = ctx.channel_id
+            poll_data.guild_id = ctx.guild_id
 
             # sanity check options
             if len(options) > len(self.emoji):
@@ -254,6 +418,8 @@ class Polls(commands.Cog):
                 icon_url=ctx.author.avatar_url,
                 text=f"Asked by {ctx.author.display_name} {single_text}{time_text}",
             )
+            poll_data.footer_text = embed.footer.text
+            poll_data.footer_icon = str(ctx.author.avatar_url)
 
             # pick an emoji list
             if len(options) == 2:
@@ -319,9 +485,10 @@ class Polls(commands.Cog):
             await ctx.send("To close the poll, react to it with 🔴", hidden=True)
 
             poll_data.message_id = msg.id
-            await asyncio.to_thread(
-                self.redis.set, msg.id, jsonpickle.encode(poll_data.__dict__)
-            )
+            if isinstance(msg, discord.Message):
+                self.bot.cacheMessage(msg)
+            await self.store.create(poll_data)
+            self.scheduleClose(poll_data)
         except Exception as e:
             log.error(e)
             exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -427,7 +594,7 @@ class Polls(commands.Cog):
             )
         if poll:
             message = await self.bot.getMessage(
-                poll.message_id, self.bot.get_channel(poll.channel_id)
+                poll.message_id, self.bot.get_channel(poll.channel_id), partial=bool(poll.footer_text)
             )
             total_options = len(poll.options)
             if total_options >= len(self.emoji):
@@ -476,7 +643,7 @@ class Polls(commands.Cog):
             )
         if poll:
             message = await self.bot.getMessage(
-                poll.message_id, self.bot.get_channel(poll.channel_id)
+                poll.message_id, self.bot.get_channel(poll.channel_id), partial=bool(poll.footer_text)
             )
 
             total_options = len(poll.options)
@@ -486,6 +653,7 @@ class Polls(commands.Cog):
                 )
             temp_option = copy(poll.options[option_index - 1])
             poll.options.pop(option_index - 1)
+            await self.store.removeOption(poll.message_id, option_index - 1)
 
             await self.update_poll_message(ctx, message, poll)
             await ctx.send(f"`{temp_option.text}` was removed from the poll")
@@ -527,7 +695,7 @@ class Polls(commands.Cog):
             )
         if poll:
             message = await self.bot.getMessage(
-                poll.message_id, self.bot.get_channel(poll.channel_id)
+                poll.message_id, self.bot.get_channel(poll.channel_id), partial=bool(poll.footer_text)
             )
             poll.title = poll_title
 
@@ -540,14 +708,17 @@ class Polls(commands.Cog):
             )
 
     async def update_poll_message(self, ctx, message, poll):
-        old_embed = message.embeds[0]
         new_embed = utilities.defaultEmbed(title=f"Poll - {poll.title}")
-        new_embed.set_footer(
-            text=old_embed.footer.text, icon_url=old_embed.footer.icon_url
-        )
-        total_votes = 0
-        for _option in poll.options:
-            total_votes += len(_option.voters)
+        if poll.footer_text:
+            new_embed.set_footer(
+                text=poll.footer_text, icon_url=poll.footer_icon or discord.Embed.Empty
+            )
+        else:
+            old_embed = message.embeds[0]
+            new_embed.set_footer(
+                text=old_embed.footer.text, icon_url=old_embed.footer.icon_url
+            )
+        total_votes = poll.total_votes
         buttons = []
         if len(poll.options) == 0:
             new_embed.description = "If there are no options, can we finally agree?"
@@ -556,7 +727,7 @@ class Polls(commands.Cog):
                 _option = poll.options[i]
                 new_embed.add_field(
                     name=f"{_option.emoji} {_option.text}",
-                    value=self.create_bar(len(_option.voters), total_votes),
+                    value=self.create_bar(_option.votes, total_votes),
                     inline=False,
                 )
                 buttons.append(
@@ -567,7 +738,7 @@ class Polls(commands.Cog):
                     )
                 )
             new_embed.description = f"{total_votes} vote{'s' if total_votes > 1 or total_votes == 0 else ''}"
-        await asyncio.to_thread(self.redis.set, message.id, jsonpickle.encode(poll))
+        await self.store.saveMeta(poll)
 
         # assemble action_rows
         action_row_buttons = []
@@ -589,30 +760,22 @@ class Polls(commands.Cog):
 
     async def reactionProcessor(self, payload: discord.RawReactionActionEvent):
         """Processing the reaction event to determine if a poll needs updating"""
-        channel: discord.TextChannel = self.bot.get_channel(payload.channel_id)
-        message: discord.Message = await self.bot.getMessage(
-            messageID=payload.message_id, channel=channel
-        )
+        # this runs for every reaction the bot can see, so rule out everything but polls before any requests
+        if payload.message_id not in self.store:
+            return
         if payload.user_id == self.bot.user.id:
             return
 
-        if message:
-            if (
-                message.author == self.bot.user
-                and message.embeds
-                and "Poll" in message.embeds[0].title
-            ):
-
-                if payload.event_type == "REACTION_ADD":
-                    if "🔴" == payload.emoji.name:
-                        # checks if user is trying to close poll, and that user is the author
-                        poll = await self.get_poll(message.id)
-                        try:
-                            if payload.user_id == int(poll.author_id):
-                                return await self.close_poll(poll)
-                        except TypeError:
-                            # this will be none if the author deleted their reaction before the poll could be closed
-                            return
+        if payload.event_type == "REACTION_ADD":
+            if "🔴" == payload.emoji.name:
+                # checks if user is trying to close poll, and that user is the author
+                poll = await self.get_poll(payload.message_id)
+                try:
+                    if payload.user_id == int(poll.author_id):
+                        return await self.close_poll(poll)
+                except (TypeError, AttributeError):
+                    # this will be none if the author deleted their reaction before the poll could be closed
+                    return
 
 
 def setup(bot):
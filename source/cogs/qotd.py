@@ -2,19 +2,17 @@ import asyncio
 import logging
 import random
 import discord_slash.error
-from collections import Counter
 from datetime import datetime
+from time import perf_counter
 
 import discord
-from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers import cron
 from discord.ext import commands, tasks
 from discord_slash import cog_ext, SlashContext
 from discord_slash.utils import manage_commands
-from fuzzywuzzy import fuzz
 
-from source import utilities, dataclass, checks, jsonManager
+from source import utilities, dataclass, checks, jsonManager, questionDeck, dispatcher, similarity, corpus, prefetch
 
 log = utilities.getLog("Cog::qotd")
 log.setLevel(logging.DEBUG)
@@ -31,117 +29,118 @@ class QOTD(commands.Cog):
         # chance it can fail if not checked second by second
         self.scheduler = AsyncIOScheduler()  # the task scheduler
 
+        self.corpus = corpus.DefaultCorpus(bot.db)
+        """The default questions, shared by every guild"""
+
+        self.decks = questionDeck.DeckManager(bot.db, self.corpus)
+        """Each guild's shuffled deck of questions"""
+
+        self.prefetched = prefetch.PrefetchCache()
+        """Posts prepared shortly before each guild's send time"""
+
+        self.dispatcher = dispatcher.QOTDDispatcher(
+            bot,
+            self.sendTask,
+            self.preparePost,
+            claim=bot.leases.claim,
+            storePath=f"data/schedule{bot.shardTag}.sqlite",
+        )
+        """Sends qotd to every guild due in a minute slot"""
+
+        self.similarity = similarity.SimilarityIndex(bot.db)
+        """Finds near duplicates of a guild's questions"""
+
     async def rescheduleTask(self, guildID):
         """Reschedules a task"""
-        guildID = str(guildID)
-        guildData = await self.bot.db.execute(
-            f"SELECT * FROM QOTDBot.guilds WHERE guildID = '{guildID}'", getOne=True
-        )
-        time = utilities.convertTime(guildData["timeZone"], guildData["sendTime"])
+        guildData = await self.bot.guildConfigs.get(guildID)
         try:
-            self.scheduler.reschedule_job(
-                job_id=guildID, trigger=cron.CronTrigger(hour=time.hour, minute=0)
-            )
-            log.debug(f"Job {guildID} rescheduled to {time.hour:02}:{time.minute:02}")
-        except JobLookupError:
-            # if job doesnt exist, create one
-            self.scheduler.add_job(
-                id=str(guildID),
-                name=f"QOTD TASK FOR {guildID}",
-                trigger=cron.CronTrigger(hour=time.hour, minute=time.minute),
-                func=self.sendTask,
-                kwargs={"guildID": guildID},
-            )
-            log.debug(f"Job {guildID} created for {time.hour:02}:{time.minute:02}")
+            if guildData.isSetup and self.bot.runsGuild(guildID):
+                self.dispatcher.schedule(guildID, guildData.timeZone, guildData.sendTime)
+                log.debug(f"{guildID} scheduled for {guildData.sendTime:02}:00 {guildData.timeZone}")
         except Exception as e:
             log.error(f"Failed to reschedule job:{guildID}. Reason: {e}")
 
     async def setup(self):
-        """Creates the jobs for sending qotd to servers"""
+        """Schedules sending qotd to servers"""
         try:
-            guilds = await self.bot.db.execute(f"SELECT * FROM QOTDBot.guilds")
-            for guild in guilds:
-                try:
-                    if bool(guild["enabled"]):
-                        if (
-                            guild["qotdChannel"] is not None
-                            and guild["timeZone"] is not None
-                            and guild["sendTime"] is not None
-                        ):
-                            # "if all required vars are set"
-                            if self.bot.get_guild(int(guild["guildID"])):
-                                qotdChannel = self.bot.get_channel(
-                                    int(guild["qotdChannel"])
-                                )
-                                if qotdChannel:
-                                    timeZone = guild["timeZone"]
-                                    sendTime = guild["sendTime"]
-
-                                    # convert time to local time and schedule a task
-                                    time = utilities.convertTime(timeZone, sendTime)
-                                    job = self.scheduler.add_job(
-                                        id=str(guild["guildID"]),
-                                        name=f"QOTD TASK FOR {guild['guildID']}",
-                                        trigger=cron.CronTrigger(
-                                            hour=time.hour, minute=time.minute
-                                        ),
-                                        func=self.sendTask,
-                                        kwargs={"guildID": guild["guildID"]},
-                                    )
-
-                                    log.debug(
-                                        f"Created job {job.id} @ {time.hour:02}:{time.minute:02} [{timeZone}:{sendTime:02}:00]"
-                                    )
-                except Exception as e:
-                    log.critical(
-                        f"Error while creating QOTD job for {guild['guildID']}: {e}"
-                    )
-            log.info("Starting AIOScheduler")
+            await self.corpus.load()
+            await self.decks.setup()
+            self.defaultQuestionsTask.start()
+
+            # the guild config cache has already been bulk loaded at startup
+            if self.bot.guildConfigs.loaded:
+                guilds = []
+                for guild in self.bot.guildConfigs.all():
+                    # "if all required vars are set"
+                    if guild.isSetup and self.bot.runsGuild(guild.guildID) and self.bot.get_guild(guild.guildID):
+                        if self.bot.get_channel(guild.qotdChannel):
+                            guilds.append(guild)
+                self.dispatcher.reconcile(guilds)
+            else:
+                # without the guilds table every guild would look removed, so run the schedule we saved
+                log.warning("Guild configs failed to load, using the saved schedule as is")
+                self.dispatcher.store.load()
+            self.bot.leases.addListener(self.onLeasesChanged)
+
+            # one job wakes the dispatcher every minute, it sends to everyone due in that slot
+            self.scheduler.add_job(
+                id="dispatcher",
+                name="QOTD DISPATCHER",
+                trigger=cron.CronTrigger(second=0),
+                func=self.dispatcher.tick,
+                misfire_grace_time=30,
+                coalesce=True,
+                max_instances=2,
+            )
             self.scheduler.start()
+            log.info(
+                f"Scheduler armed {perf_counter() - self.bot.readyAt:.2f}s after gateway ready, "
+                f"{len(self.dispatcher)} guilds scheduled"
+            )
+
+            # send anything we missed while offline now, rather than waiting for the next tick
+            asyncio.create_task(self.dispatcher.tick())
         except Exception as e:
             log.critical(f"Error while setting up QOTD job: {e}")
 
+    async def onLeasesChanged(self, gained: set, lost: set):
+        """We've taken over shards from another process, send anything it didn't get to"""
+        if gained and self.scheduler.running:
+            asyncio.create_task(self.dispatcher.tick())
+
+    @tasks.loop(hours=1)
+    async def defaultQuestionsTask(self):
+        """Reloads the default questions if they have changed, so decks can shuffle new ones in"""
+        if self.defaultQuestionsTask.current_loop == 0:
+            # setup has just loaded them
+            return
+        if await self.corpus.refresh():
+            # a prepared question might not exist anymore
+            self.prefetched.clear()
+
     async def checkSimilarity(self, ctx, question, mode, embed):
         # prevent duplicate questions being added
-        questPool = await self.bot.db.execute(
-            f"SELECT * FROM QOTDBot.questions WHERE guildID = '{mode}'"
-        )
-        if len(questPool) > 0:
-            results = {}
-            for _quest in questPool:
-                fuzzResult = fuzz.ratio(
-                    question.lower(), _quest["questionText"].lower()
-                )
-                results[_quest["questionText"]] = fuzzResult
-            # mostSimilar = max(results, key=results.get)
-
-            topQuestions = Counter(results)
-            mostSimilar = topQuestions.most_common(3)
-            mostSimilarList = []
-            for _q in mostSimilar:
-                if _q[1] >= 80:
-                    mostSimilarList.append(_q[0])
-
-            if mostSimilarList:
-                # add top 3 matches to list
-                _emb = embed.copy()
-                _emb.colour = discord.Colour.dark_orange()
-                _emb.title = "Similar Question Found:"
-                if len(mostSimilarList) > 1:
-                    _emb.title = "Similar Questions Found:"
-                _emb.description = ""
-                for _q in mostSimilarList:
-                    _emb.description += f"- `{_q}`\n"
-                _emb.description += "\nWould you like to add anyway?"
-                message = await ctx.send(embed=_emb)
-                accept = await utilities.YesOrNoReactionCheck(ctx, message)
-                if not accept:
-                    await message.edit(
-                        embed=utilities.defaultEmbed(
-                            colour=discord.Colour.dark_red(), title="Cancelled 👌"
-                        )
+        mostSimilarList = await self.similarity.similar(mode, question)
+        if mostSimilarList:
+            # add top 3 matches to list
+            _emb = embed.copy()
+            _emb.colour = discord.Colour.dark_orange()
+            _emb.title = "Similar Question Found:"
+            if len(mostSimilarList) > 1:
+                _emb.title = "Similar Questions Found:"
+            _emb.description = ""
+            for _q in mostSimilarList:
+                _emb.description += f"- `{_q}`\n"
+            _emb.description += "\nWould you like to add anyway?"
+            message = await ctx.send(embed=_emb)
+            accept = await utilities.YesOrNoReactionCheck(ctx, message)
+            if not accept:
+                await message.edit(
+                    embed=utilities.defaultEmbed(
+                        colour=discord.Colour.dark_red(), title="Cancelled 👌"
                     )
-                    return False
+                )
+                return False
         return True
 
     @commands.check(checks.checkAll)
@@ -159,11 +158,14 @@ class QOTD(commands.Cog):
         )
 
         if await self.checkSimilarity(ctx, question, mode, embed):
-            question = await self.bot.db.escape(question)
-            await self.bot.db.execute(
-                f"INSERT INTO QOTDBot.questions (questionText, guildID) "
-                f"VALUES ('{question}', '{mode}')"
+            questionID = await self.bot.db.insert(
+                "INSERT INTO QOTDBot.questions (questionText, guildID) VALUES (%s, %s)",
+                (question, str(mode)),
             )
+            if questionID:
+                await self.decks.addQuestion(mode, questionID)
+                self.prefetched.invalidate(mode)
+                await self.similarity.add(mode, questionID, question)
             embed.title = "Added Question"
             await ctx.send(embed=embed)
 
@@ -173,11 +175,8 @@ class QOTD(commands.Cog):
         if not await checks.checkAll(ctx):  # decorators arent 100% reliable yet
             raise discord_slash.error.CheckFailure
         await ctx.defer()
-        info = await self.bot.db.execute(
-            f"SELECT qotdChannel FROM QOTDBot.guilds WHERE guildID = '{ctx.guild.id}'",
-            getOne=True,
-        )
-        channel = self.bot.get_channel(int(info["qotdChannel"]))
+        info = await self.bot.guildConfigs.get(ctx.guild.id)
+        channel = self.bot.get_channel(info.qotdChannel)
         if not channel:
             return await ctx.send(
                 "There was an error accessing your qotd channel, do i have permission to send in it?"
@@ -193,24 +192,7 @@ class QOTD(commands.Cog):
         if not await checks.checkAll(ctx):  # decorators arent 100% reliable yet
             raise discord_slash.error.CheckFailure
         await ctx.defer()
-        customQuestions = await self.bot.db.execute(
-            f"""SELECT COUNT(*) FROM QOTDBot.questions
-WHERE questions.guildID = '{ctx.guild.id}' AND questionID NOT IN (
-SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID = '{ctx.guild.id}'
-)""",
-            getOne=True,
-        )
-
-        defaultQuestions = await self.bot.db.execute(
-            f"""SELECT COUNT(*) FROM QOTDBot.questions
-WHERE questions.guildID = '0' AND questionID NOT IN (
-SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID = '{ctx.guild.id}'
-)""",
-            getOne=True,
-        )
-
-        customQuestions = customQuestions["COUNT(*)"]
-        defaultQuestions = defaultQuestions["COUNT(*)"]
+        customQuestions, defaultQuestions = await self.decks.remaining(ctx.guild.id)
 
         _emb = utilities.defaultEmbed(title="Remaining questions")
         _emb.add_field(name="Default Questions:", value=defaultQuestions)
@@ -235,20 +217,26 @@ SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID
             raise discord_slash.error.CheckFailure
         HideQuestion = True if hidequestion == "True" else False
         await ctx.defer(hidden=HideQuestion)
-        question = await self.bot.db.escape(question)
+        similarQuestions = await self.similarity.similar(ctx.guild.id, question)
         await self.bot.db.execute(
-            f"INSERT INTO QOTDBot.suggestedQuestions (question, authorID, guildID) VALUES "
-            f"('{question}', {ctx.author.id}, {ctx.guild.id})"
+            "INSERT INTO QOTDBot.suggestedQuestions (question, authorID, guildID) VALUES (%s, %s, %s)",
+            (question, ctx.author.id, ctx.guild.id),
         )
+        warning = ""
+        if similarQuestions:
+            warning = "Heads up, this looks similar to a question this server already has:\n" + "\n".join(
+                f"- `{_q}`" for _q in similarQuestions
+            )
         if HideQuestion:
-            await ctx.send(content="Your question has been submitted")
+            await ctx.send(content=f"Your question has been submitted\n{warning}".strip())
         else:
-            await ctx.send(
-                embed=utilities.defaultEmbed(
-                    title=f"Your Question Has Been Submitted",
-                    colour=discord.Colour.green(),
-                )
+            embed = utilities.defaultEmbed(
+                title=f"Your Question Has Been Submitted",
+                colour=discord.Colour.green(),
             )
+            if warning:
+                embed.description = warning
+            await ctx.send(embed=embed)
 
     @commands.check(checks.checkAll)
     @cog_ext.cog_subcommand(**jsonManager.getDecorator("suggestion.list"))
@@ -256,8 +244,9 @@ SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID
         if not await checks.checkUserAll(ctx):  # decorators arent 100% reliable yet
             raise discord_slash.error.CheckFailure
         await ctx.defer()
-        data = await self.bot.db.execute(
-            f"SELECT * FROM QOTDBot.suggestedQuestions WHERE guildID = '{ctx.guild.id}'"
+        data = await self.bot.db.fetchAll(
+            "SELECT * FROM QOTDBot.suggestedQuestions WHERE guildID = %s",
+            (str(ctx.guild.id),),
         )
         emb = utilities.defaultEmbed(title="Suggested Questions")
 
@@ -282,8 +271,9 @@ SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID
         if not await checks.checkUserAll(ctx):  # decorators arent 100% reliable yet
             raise discord_slash.error.CheckFailure
         await ctx.defer()
-        data = await self.bot.db.execute(
-            f"SELECT * FROM QOTDBot.suggestedQuestions WHERE guildID = '{ctx.guild.id}'"
+        data = await self.bot.db.fetchAll(
+            "SELECT * FROM QOTDBot.suggestedQuestions WHERE guildID = %s",
+            (str(ctx.guild.id),),
         )
         emb = utilities.defaultEmbed(title="Approved Question")
 
@@ -305,14 +295,18 @@ SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID
             if await self.checkSimilarity(
                 ctx, questData["question"], ctx.guild.id, emb
             ):
-                question = await self.bot.db.escape(questData["question"])
                 await self.bot.db.execute(
-                    f"DELETE FROM QOTDBot.suggestedQuestions WHERE suggestionID = {questData['suggestionID']}"
+                    "DELETE FROM QOTDBot.suggestedQuestions WHERE suggestionID = %s",
+                    (questData["suggestionID"],),
                 )
-                await self.bot.db.execute(
-                    f"INSERT INTO QOTDBot.questions (questionText, guildID) "
-                    f"VALUES ('{question}', '{ctx.guild.id}')"
+                questionID = await self.bot.db.insert(
+                    "INSERT INTO QOTDBot.questions (questionText, guildID) VALUES (%s, %s)",
+                    (questData["question"], str(ctx.guild.id)),
                 )
+                if questionID:
+                    await self.decks.addQuestion(ctx.guild.id, questionID)
+                    self.prefetched.invalidate(ctx.guild.id)
+                    await self.similarity.add(ctx.guild.id, questionID, questData["question"])
             else:
                 return
         except Exception as e:
@@ -334,8 +328,9 @@ SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID
         if not await checks.checkUserAll(ctx):  # decorators arent 100% reliable yet
             raise discord_slash.error.CheckFailure
         await ctx.defer()
-        data = await self.bot.db.execute(
-            f"SELECT * FROM QOTDBot.suggestedQuestions WHERE guildID = '{ctx.guild.id}'"
+        data = await self.bot.db.fetchAll(
+            "SELECT * FROM QOTDBot.suggestedQuestions WHERE guildID = %s",
+            (str(ctx.guild.id),),
         )
         emb = utilities.defaultEmbed(title="Rejected Question")
 
@@ -355,7 +350,8 @@ SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID
 
         try:
             await self.bot.db.execute(
-                f"DELETE FROM QOTDBot.suggestedQuestions WHERE suggestionID = {questData['suggestionID']}"
+                "DELETE FROM QOTDBot.suggestedQuestions WHERE suggestionID = %s",
+                (questData["suggestionID"],),
             )
         except Exception as e:
             log.error(e)
@@ -376,94 +372,60 @@ SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID
         qotdChannel: discord.TextChannel,
         rolesToMention=None,
         customPriority: bool = False,
+        questionLog: list = None,
     ):
-        """Selects a question to be posted, from both the default list and custom list"""
+        """Selects a question to be posted, from both the default list and custom list
+        If questionLog is passed, the posted question is added to it rather than being logged straight away"""
         qotdMessage = None
 
         try:
-            await qotdChannel.trigger_typing()
-            question = None
-            source = "Default Question"
-            guildConfig = await self.bot.db.execute(
-                f"SELECT * FROM QOTDBot.guilds WHERE guildID = '{guild.id}'",
-                getOne=True,
-            )
-            # get question from DB
-            customQuestion = await self.bot.db.execute(
-                "SELECT * FROM QOTDBot.questions "
-                f"WHERE guildID = '{guild.id}' AND questionID NOT IN ("
-                f"SELECT questionID FROM QOTDBot.questionLog "
-                f"WHERE questionLog.guildID = '{guild.id}')"
-                f"ORDER BY RAND() LIMIT 1",
-                getOne=True,
-            )
-
-            defaultQuestion = await self.bot.db.execute(
-                "SELECT * FROM QOTDBot.questions "
-                f"WHERE guildID = '0' AND questionID NOT IN ("
-                f"SELECT questionID FROM QOTDBot.questionLog "
-                f"WHERE questionLog.guildID = '{guild.id}')"
-                f"ORDER BY RAND() LIMIT 1",
-                getOne=True,
-            )
-            if customQuestion:
-                source = "Custom Question"
-                question = customQuestion
-            elif defaultQuestion:
-                source = "Default Question"
-                question = defaultQuestion
-            else:
-                return log.error("No questions left!")
-
-            emb = discord.Embed(colour=discord.Colour.blurple())
-            if len(question["questionText"]) > 200:
-                emb.description = question["questionText"]
-                emb.title = "Question of The Day"
-            else:
-                emb.title = question["questionText"]
-            emb.set_footer(
-                icon_url=self.bot.user.avatar_url,
-                text=f"{self.bot.user.name} • {source}",
-            )
+            if questionLog is None:
+                # no point showing typing for a batch, it'd just be another request
+                await qotdChannel.trigger_typing()
+            guildConfig = await self.bot.guildConfigs.get(guild.id)
+            prepared = self.prefetched.take(guild.id)
+            if prepared is None:
+                prepared = await self.prepare(guild.id)
+            if prepared is None:
+                return log.error(f"No question to post in {guild.id}")
+            question = {"questionID": prepared.questionID}
+            emb = prepared.embed
             try:
                 qotdMessage = await qotdChannel.send(embed=emb)
 
                 # if guild wants qotd pinning
-                if guildConfig["pinMessage"] == 1:
+                if guildConfig.pinMessage:
                     await qotdMessage.pin(reason="/setup pin is enabled")
 
                 # if guild wants a role to be pinged, this ghost pings them
-                if guildConfig["mentionRole"] is not None:
-                    role: discord.Role = guild.get_role(int(guildConfig["mentionRole"]))
+                if guildConfig.mentionRole is not None:
+                    role: discord.Role = guild.get_role(guildConfig.mentionRole)
                     if role:
                         msg = await qotdChannel.send(
                             role.mention, allowed_mentions=discord.AllowedMentions.all()
                         )
-                        await asyncio.sleep(1)
-                        await msg.delete()
+                        await msg.delete(delay=1)
 
             except Exception as e:
                 if qotdMessage is not None:
-                    await self.bot.db.execute(
-                        f"INSERT INTO QOTDBot.questionLog (questionID, guildID, posted, datePosted) "
-                        f"VALUES ({question['questionID']}, '{guild.id}', TRUE, '{datetime.now()}')"
-                    )
+                    await self.logQuestion(guild, question, questionLog)
                     if "maximum number of pins" in str(e).lower():
                         await qotdMessage.edit(
                             content="⚠ Unable to pin: maximum pins in channel"
                         )
                     return True
                 else:
+                    if isinstance(e, discord.Forbidden):
+                        raise
                     log.error(f"Unable to post question to {guild.id}: {e}")
             else:
-                await self.bot.db.execute(
-                    f"INSERT INTO QOTDBot.questionLog (questionID, guildID, posted, datePosted) "
-                    f"VALUES ({question['questionID']}, '{guild.id}', TRUE, '{datetime.now()}')"
-                )
+                await self.logQuestion(guild, question, questionLog)
                 return True
         except discord.Forbidden:
             try:
-                await guild.owner.send(
+                # without the member cache the owner usually isn't cached
+                owner = guild.owner or await self.bot.fetch_user(guild.owner_id)
+                await owner.send(
                     "An error occurred while trying to send your question, "
                     "I am missing permissions in your requested channel. Please make sure I can "
                     "send messages, manage messages, embed links, and add reactions in the desired channel"
@@ -480,36 +442,105 @@ SELECT questionLog.questionID FROM QOTDBot.questionLog WHERE questionLog.guildID
             log.error(f"Missing permissions to send qotd in {guild.id}: {guild.name}")
             return False
 
-    async def sendTask(self, guildID):
-        """The scheduled task for sending qotd"""
-        me = self.scheduler.get_job(job_id=str(guildID))
-        _guild = await self.bot.db.execute(
-            "SELECT * FROM QOTDBot.guilds " f"WHERE guildID = '{guildID}'", getOne=True
-        )
+    async def prepare(self, guildID) -> (prefetch.PreparedPost, None):
+        """Resolves a guild's next question and builds its embed, without sending anything
+        :return: the prepared post, or None if the guild has run out of questions or one couldn't be read"""
+        question = None
+        source = "Default Question"
+        # get the next question from the guild's deck
         try:
-            if _guild["enabled"] == 0:
-                log.debug(f"{guildID} disabled qotd, not sending")
-                return
-        except TypeError:
-            # for some reason this guild isnt in our DB? We should check if we're even still in the guild
-            guild = self.bot.get_guild(int(guildID))
-            if not guild:
-                # guild gone, delete this job
-                log.warning(f"Can no longer access {guildID}, cancelling job")
-                me.remove()
-                return
-        guild = self.bot.get_guild(int(guildID))
-        if guild:
-            qotdChannel = _guild["qotdChannel"]
-            qotdChannel = self.bot.get_channel(int(qotdChannel))
-            if qotdChannel:
-                await self.onPost(guild, qotdChannel)
+            while (nextQuestion := await self.decks.peek(guildID)) is not None:
+                questionID, isCustom = nextQuestion
+                if isCustom:
+                    try:
+                        question = await self.bot.db.fetchOne(
+                            "SELECT * FROM QOTDBot.questions WHERE questionID = %s", (questionID,), raiseErrors=True
+                        )
+                    except Exception as e:
+                        # we can't tell if it was deleted, so leave the deck alone and skip this post
+                        log.error(f"Failed to read custom question {questionID} for {guildID}: {e}")
+                        return None
+                else:
+                    # default questions come from memory
+                    text = self.corpus.text(questionID)
+                    question = {"questionID": questionID, "questionText": text} if text else None
+                    if question is None and not (self.corpus.loaded and questionID <= self.corpus.maxID):
+                        # the pool hasn't caught up with this question, it hasn't been deleted
+                        log.warning(f"Default question {questionID} isn't loaded, skipping the post in {guildID}")
+                        return None
+                if question:
+                    source = "Custom Question" if isCustom else "Default Question"
+                    break
+                # this question has been deleted since the deck was dealt
+                await self.decks.consume(guildID, questionID)
+        except Exception as e:
+            log.error(f"Failed to read {guildID}'s deck, skipping the post: {e}")
+            return None
+        if not question:
+            return None
+
+        emb = discord.Embed(colour=discord.Colour.blurple())
+        if len(question["questionText"]) > 200:
+            emb.description = question["questionText"]
+            emb.title = "Question of The Day"
+        else:
+            emb.title = question["questionText"]
+        emb.set_footer(
+            icon_url=self.bot.user.avatar_url,
+            text=f"{self.bot.user.name} • {source}",
+        )
+        return prefetch.PreparedPost(int(guildID), question["questionID"], isCustom, emb)
 
+    async def preparePost(self, guildData) -> bool:
+        """Prepares a guild's post ahead of its slot, called by the dispatcher"""
+        prepared = await self.prepare(guildData.guildID)
+        if prepared is None:
+            return False
+        self.prefetched.put(prepared)
+        return True
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.prefetched.invalidate(guild.id)
+        self.similarity.drop(guild.id)
+        self.dispatcher.unschedule(guild.id)
+
+    async def logQuestion(self, guild: discord.Guild, question: dict, questionLog: list = None):
+        """Records that a question has been asked in a guild"""
+        row = (question["questionID"], str(guild.id), datetime.now())
+        if questionLog is not None:
+            questionLog.append(row)
         else:
+            await self.bot.db.execute(
+                "INSERT INTO QOTDBot.questionLog (questionID, guildID, posted, datePosted) "
+                "VALUES (%s, %s, TRUE, %s)",
+                row,
+            )
+        try:
+            await self.decks.consume(guild.id, question["questionID"])
+        except Exception as e:
+            # it has already been posted, so this isn't worth failing the post over
+            log.error(f"Failed to move {guild.id}'s deck past question {question['questionID']}: {e}")
+        # the deck has moved on, so anything prepared is now out of date
+        self.prefetched.invalidate(guild.id)
+
+    async def sendTask(self, guildData, questionLog: list = None) -> bool:
+        """Sends qotd to a guild, called by the dispatcher for each guild in a slot"""
+        guildID = guildData.guildID
+        if not guildData.enabled:
+            log.debug(f"{guildID} disabled qotd, not sending")
+            return False
+
+        guild = self.bot.get_guild(guildID)
+        if not guild:
             log.warning(f"Can no longer access {guildID}, cancelling job")
-            me.remove()
-            return
-        log.debug(f"Job for {guildID} has run, next run at {me.next_run_time}")
+            self.dispatcher.unschedule(guildID)
+            return False
+
+        qotdChannel = self.bot.get_channel(guildData.qotdChannel)
+        if qotdChannel:
+            return bool(await self.onPost(guild, qotdChannel, questionLog=questionLog))
+        return False
 
 
 def setup(bot):
@@ -0,0 +1,106 @@
+import bisect
+import logging
+from array import array
+
+from . import utilities
+
+log = utilities.getLog("corpus", logging.INFO)
+
+
+class DefaultCorpus:
+    """The default question pool, held in memory once for every guild
+
+    Questions are stored as a sorted array of ids, an array of offsets, and one packed utf-8 blob,
+    rather than a dict of row dicts"""
+
+    def __init__(self, db):
+        self.db = db
+
+        self.ids = array("I")
+        """Question ids, ascending"""
+
+        self.offsets = array("I", [0])
+        """Where each question's text starts in the blob, with one extra entry marking the end"""
+
+        self.blob = b""
+
+        self.version: tuple = None
+        """(count, largest id) of the pool when it was loaded"""
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, questionID):
+        i = bisect.bisect_left(self.ids, questionID)
+        return i < len(self.ids) and self.ids[i] == questionID
+
+    @property
+    def maxID(self) -> int:
+        return self.ids[-1] if self.ids else 0
+
+    @property
+    def loaded(self) -> bool:
+        """Has the pool been read successfully"""
+        return len(self.ids) > 0
+
+    async def _currentVersion(self) -> tuple:
+        result = await self.db.fetchOne(
+            "SELECT COUNT(*) AS total, MAX(questionID) AS highWater FROM QOTDBot.questions WHERE guildID = '0'",
+            raiseErrors=True,
+        )
+        result = result or {}
+        return result.get("total") or 0, result.get("highWater") or 0
+
+    async def load(self) -> bool:
+        """Reads the whole default pool
+        :return: False if it couldn't be read, the pool already in memory is kept"""
+        try:
+            rows = await self.db.fetchAll(
+                "SELECT questionID, questionText FROM QOTDBot.questions WHERE guildID = '0' ORDER BY questionID",
+                raiseErrors=True,
+            )
+        except Exception as e:
+            log.error(f"Failed to load default questions: {e}")
+            return False
+        if not rows and self.loaded:
+            # the pool is never emptied on purpose, so don't let a bad read wipe it
+            log.warning("Read no default questions, keeping the ones already loaded")
+            return False
+        ids = array("I")
+        offsets = array("I", [0])
+        chunks = []
+        position = 0
+        for row in rows:
+            text = row["questionText"].encode("utf-8")
+            chunks.append(text)
+            position += len(text)
+            ids.append(row["questionID"])
+            offsets.append(position)
+
+        self.ids, self.offsets, self.blob = ids, offsets, b"".join(chunks)
+        self.version = (len(ids), self.maxID)
+        log.info(f"Loaded {len(ids)} default questions ({len(self.blob) / 1024:.1f}KiB)")
+        return True
+
+    async def refresh(self) -> bool:
+        """Reloads the pool if it has changed since it was loaded
+        :return: True if it was reloaded"""
+        try:
+            version = await self._currentVersion()
+        except Exception as e:
+            log.error(f"Failed to check default questions for changes: {e}")
+            return False
+        if version == self.version:
+            return False
+        return await self.load()
+
+    def text(self, questionID: int) -> (str, None):
+        """The text of a default question, or None if there isn't one with that id"""
+        i = bisect.bisect_left(self.ids, questionID)
+        if i < len(self.ids) and self.ids[i] == questionID:
+            return self.blob[self.offsets[i]: self.offsets[i + 1]].decode("utf-8")
+        return None
+
+    def idsAbove(self, questionID: int) -> array:
+        """Every question id larger than the one given"""
+        return self.ids[bisect.bisect_right(self.ids, questionID):]
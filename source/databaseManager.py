@@ -3,12 +3,14 @@ import json
 import logging
 import os
 import time
+import weakref
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from time import time, sleep
+from time import time, sleep, monotonic, perf_counter
 
 import aiomysql
 import sshtunnel
+from pymysql.converters import escape_string
 
 from . import utilities
 
@@ -47,6 +49,11 @@ localPort = data['localPort']
 sshUser = data['sshUser']
 DBUser = data['dbUser']
 DBPass = data['dbPass']
+validateAfter = data.get('validateAfter', 30)  # seconds a connection can sit idle before it gets pinged
+poolSize = int(os.environ.get("QOTD_DB_POOL", 10))  # the cluster launcher splits connections between processes
+
+# mysql client errors that mean the connection itself died, rather than the query being bad
+connectionLostErrors = (2006, 2013, 2055)
 
 
 class DBConnector:
@@ -58,15 +65,24 @@ class DBConnector:
         self.operations = 0
         self.time = Time
 
+        self.validateAfter = validateAfter
+        """How long a connection can be idle before it is pinged prior to use"""
+        self.lastUsed = weakref.WeakKeyDictionary()
+        """When each pooled connection was last used"""
+        self.pings = 0
+        self.reconnects = 0
+        self.validationTime = 0.0
+        self.queryTime = 0.0
+
     def teardown(self):
         if self.tunnel:
             self.tunnel.close()
         self.threadPool.shutdown(wait=True)
 
     async def escape(self, inputString: str):
-        """Escape the input"""
-        async with self.dbPool.acquire() as conn:
-            return conn.escape_string(inputString)
+        """Escape the input
+        Prefer passing values as params to execute, this only exists for queries that cant be parameterised"""
+        return escape_string(inputString)
 
     async def _connect(self):
         """Creates a connection to the database, either directly or through a tunnel"""
@@ -78,7 +94,7 @@ class DBConnector:
                 host="127.0.0.1",
                 port=3306,
                 auth_plugin="mysql_native_password",
-                maxsize=10
+                maxsize=poolSize
             )
         except:
             # Probably working on a dev machine, create a tunnel
@@ -104,7 +120,7 @@ class DBConnector:
                     host=self.tunnel.local_bind_host,
                     port=self.tunnel.local_bind_port,
                     auth_plugin="mysql_native_password",
-                    maxsize=10,
+                    maxsize=poolSize,
                 )
             except Exception as e:
                 log.critical(f"Failed to connect to db, aborting startup: {e}")
@@ -119,45 +135,109 @@ class DBConnector:
         log.info(f"Database connection established. {len(databases)} schemas found")
         return True
 
-    async def execute(self, query: str, getOne: bool = False) -> (dict or None):
+    async def _validate(self, connection: aiomysql.Connection):
+        """Pings a connection if it has been idle long enough that the server may have dropped it"""
+        lastUsed = self.lastUsed.get(connection)
+        if lastUsed is not None and monotonic() - lastUsed < self.validateAfter:
+            return
+        start = perf_counter()
+        await connection.ping(reconnect=True)
+        self.validationTime += perf_counter() - start
+        self.pings += 1
+
+    @staticmethod
+    def _connectionLost(e: Exception) -> bool:
+        """Determines if an exception was caused by the connection dying"""
+        if isinstance(e, aiomysql.InterfaceError):
+            return True
+        if isinstance(e, aiomysql.OperationalError) and e.args:
+            return e.args[0] in connectionLostErrors
+        return False
+
+    @staticmethod
+    async def _run(connection: aiomysql.Connection, query: str, params, getOne: bool, getID: bool = False):
+        """Runs a query on the given connection"""
+        async with connection.cursor(aiomysql.SSDictCursor) as cursor:
+            # params are escaped by the driver on this connection, no need for a separate escape call
+            await cursor.execute(query, params)  # execute the query
+            if not getOne:
+                result = await cursor.fetchall()
+            else:
+                result = await cursor.fetchone()
+            if getID:
+                result = cursor.lastrowid
+            await cursor.close()
+        await connection.commit()
+        return result
+
+    async def execute(self, query: str, params: (tuple or list or dict) = None, getOne: bool = False,
+                      getID: bool = False, raiseErrors: bool = False) -> (dict or None):
         """
         Execute a database query
-        :param query: The query you want to make
+        :param query: The query you want to make, values should be %s placeholders
+        :param params: The values to bind to the query's placeholders
         :param getOne: If you only want one item, set this to True
+        :param getID: Return the id of the inserted row instead of any results
+        :param raiseErrors: Raise if the query fails, rather than logging it and returning None.
+        Use this when a failed query mustn't be mistaken for an empty result
         :return: a dict representing the mysql result, or None
         """
-
-        try:
-            # make sure we have a connection first
-            async with self.dbPool.acquire() as conn:
-                await conn.ping(reconnect=True)  # ping the database, to make sure we have a connection
-        except Exception as e:
-            log.error(f"{e}")
-            await asyncio.sleep(5)  # sleep for a few seconds
-            await self.connect()  # Attempt to reconnect
-
         try:
-            log.debug(f"Executing Query - {query}")
+            log.debug(f"Executing Query - {query} {params if params is not None else ''}")
 
             async with self.dbPool.acquire() as connection:
-                async with connection.cursor(aiomysql.SSDictCursor) as cursor:
-                    await cursor.execute(query)  # execute the query
-                    if not getOne:
-                        result = await cursor.fetchall()
-                    else:
-                        result = await cursor.fetchone()
-                    if isinstance(result, tuple):
-                        if len(result) == 0:
-                            return None
-                    await cursor.close()
-                await connection.commit()
+                await self._validate(connection)
+                start = perf_counter()
+                try:
+                    result = await self._run(connection, query, params, getOne, getID)
+                except Exception as e:
+                    if not self._connectionLost(e):
+                        raise
+                    # the connection went away between validations, revive it and try again
+                    log.warning(f"Lost database connection, reconnecting: {e}")
+                    await connection.ping(reconnect=True)
+                    self.reconnects += 1
+                    result = await self._run(connection, query, params, getOne, getID)
+                self.queryTime += perf_counter() - start
+                self.lastUsed[connection] = monotonic()
+
             self.operations += 1
+            if isinstance(result, tuple):
+                if len(result) == 0:
+                    return None
             return result
         except Exception as e:
             log.error(e)
-            if "cannot connect" in str(e):
+            if "cannot connect" in str(e).lower() or "can't connect" in str(e).lower():
                 await asyncio.sleep(5)
-                await self.execute(query=query, getOne=getOne)
+                return await self.execute(
+                    query=query, params=params, getOne=getOne, getID=getID, raiseErrors=raiseErrors
+                )
+            if raiseErrors:
+                raise
+
+    def overhead(self) -> (float, float):
+        """
+        The average time spent per query
+        :return: validation overhead in ms, query time in ms
+        """
+        if self.operations == 0:
+            return 0.0, 0.0
+        return self.validationTime / self.operations * 1000, self.queryTime / self.operations * 1000
+
+    async def fetchOne(self, query: str, params: (tuple or list or dict) = None,
+                       raiseErrors: bool = False) -> (dict or None):
+        """Execute a query and return the first row, or None"""
+        return await self.execute(query, params, getOne=True, raiseErrors=raiseErrors)
+
+    async def insert(self, query: str, params: (tuple or list or dict) = None,
+                     raiseErrors: bool = False) -> (int or None):
+        """Execute an insert and return the id of the new row"""
+        return await self.execute(query, params, getID=True, raiseErrors=raiseErrors)
+
+    async def fetchAll(self, query: str, params: (tuple or list or dict) = None, raiseErrors: bool = False) -> list:
+        """Execute a query and return every row, an empty list if there are none"""
+        return await self.execute(query, params, raiseErrors=raiseErrors) or []
 
     async def connect(self):
         """Public function to connect to the database"""
@@ -1,48 +1,148 @@
+import logging
+from collections import OrderedDict
 from pprint import pprint
 
 import discord
 from discord.ext import commands, tasks
 
-from . import databaseManager
+from . import databaseManager, guildConfig, botStats, cluster, leases, utilities
 
+log = utilities.getLog("dataclass", logging.INFO)
 
-class Bot(commands.Bot):
-    """Expands on the default bot class, and helps with type-hinting """
 
-    def __init__(self, cogList=list, *args, **kwargs):
+class Bot(commands.AutoShardedBot):
+    """Expands on the default bot class, and helps with type-hinting
+    Runs every shard it is given on one connection per shard, or all of them if it isn't given any"""
+
+    def __init__(self, cogList=list, lowMemory: bool = False, *args, **kwargs):
         self.cogList = cogList
         """A list of cogs to be mounted"""
 
+        self.lowMemory = lowMemory
+        """Members aren't cached, so member counts are discord's approximations"""
+
         self.db = databaseManager.DBConnector()
         """The bots database"""
 
+        self.guildConfigs = guildConfig.GuildConfigCache(self.db, keep=self.runsGuild)
+        """A cache of each guild's QOTD config"""
+
         self.appInfo: discord.AppInfo = None
         """A cached application info"""
 
         self.startTime = None
         """The time the bot started"""
 
-        self.shouldUpdateBL = True
-        """Should the bot try and update bot-lists"""
+        self.readyAt: float = None
+        """perf_counter() when the gateway first became ready"""
+
+        self.userCounts = botStats.UserCounter(self, approximate=lowMemory)
+        """How many humans are in each guild"""
+
+        self.stats = botStats.StatsPublisher(self)
+        """Posts our stats to bot-lists"""
+
+        self.cluster = cluster.ClusterStatus(self)
+        """Shares our status with the other clusters"""
+
+        self.leases = leases.LeaseManager(self)
+        """Which of our shards no other process is acting on"""
 
         self.perms = 0
         """The perms the bot needs"""
 
+        self.messageCache: "OrderedDict[int, discord.Message]" = OrderedDict()
+        """Our own recent messages, by id"""
+
+        self.messageCacheSize = 2000
+
         super().__init__(*args, **kwargs)
 
-    async def getMessage(self, messageID: int, channel: discord.TextChannel) -> (discord.Message, None):
+        self.add_listener(self._onMessage, "on_message")
+        self.add_listener(self._onMessageEdit, "on_message_edit")
+        self.add_listener(self._onRawMessageDelete, "on_raw_message_delete")
+        self.add_listener(self._onRawBulkMessageDelete, "on_raw_bulk_message_delete")
+
+    async def close(self):
+        """Lets cogs save anything they are holding on to, then disconnects"""
+        for cog in list(self.cogs.values()):
+            if hasattr(cog, "shutdown"):
+                try:
+                    await cog.shutdown()
+                except Exception as e:
+                    log.error(f"Failed to shut down {cog.qualified_name}: {e}")
+        await self.leases.close()
+        await self.stats.close()
+        await self.cluster.close()
+        await super().close()
+
+    @property
+    def shardTag(self) -> str:
+        """Identifies this process's shards in file names, empty if it runs every shard"""
+        if self.shard_ids is None:
+            return ""
+        return f"-{min(self.shard_ids)}-{max(self.shard_ids)}"
+
+    def shardOf(self, guildID) -> int:
+        return (int(guildID) >> 22) % (self.shard_count or 1)
+
+    def runsGuild(self, guildID) -> bool:
+        """Is this guild on one of our shards"""
+        if self.shard_ids is None:
+            return True
+        return self.shardOf(guildID) in self.shard_ids
+
+    def ownsGuild(self, guildID) -> bool:
+        """Is this guild on one of our shards, and are we the process that acts on it
+        Other processes may be running the same shards, see leases.py"""
+        return self.runsGuild(guildID) and self.leases.holds(self.shardOf(guildID))
+
+    def cacheMessage(self, message: discord.Message):
+        """Adds one of our messages to the message cache, evicting the least recently used"""
+        self.messageCache[message.id] = message
+        self.messageCache.move_to_end(message.id)
+        while len(self.messageCache) > self.messageCacheSize:
+            self.messageCache.popitem(last=False)
+
+    async def _onMessage(self, message: discord.Message):
+        if self.user and message.author.id == self.user.id:
+            self.cacheMessage(message)
+
+    async def _onMessageEdit(self, before: discord.Message, after: discord.Message):
+        if after.id in self.messageCache:
+            self.messageCache[after.id] = after
+
+    async def _onRawMessageDelete(self, payload: discord.RawMessageDeleteEvent):
+        self.messageCache.pop(payload.message_id, None)
+
+    async def _onRawBulkMessageDelete(self, payload: discord.RawBulkMessageDeleteEvent):
+        for messageID in payload.message_ids:
+            self.messageCache.pop(messageID, None)
+
+    async def getMessage(
+        self, messageID: int, channel: discord.TextChannel, partial: bool = False
+    ) -> (discord.Message, discord.PartialMessage, None):
         """Gets a message using the id given
         we dont use the built in get_message due to poor rate limit
+        :param partial: if the message isn't cached, return a PartialMessage rather than fetching it.
+        Only use this if all you want to do is edit the message
         """
-        for message in self.cached_messages:
-            if message.id == messageID:
-                return message
+        message = self.messageCache.get(messageID)
+        if message is not None:
+            self.messageCache.move_to_end(messageID)
+            return message
+        if channel is None:
+            return None
+        if partial:
+            return channel.get_partial_message(messageID)
+
         # bot has not cached this message, so search the channel for it
         try:
             o = discord.Object(id=messageID + 1)
             msg = await channel.history(limit=1, before=o).next()
 
             if messageID == msg.id:
+                self.cacheMessage(msg)
                 return msg
 
             return None
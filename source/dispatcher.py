@@ -0,0 +1,276 @@
+import asyncio
+import logging
+from datetime import datetime
+from time import monotonic, perf_counter, time
+
+from . import utilities, scheduleStore, timezones
+
+log = utilities.getLog("dispatcher", logging.INFO)
+
+
+class RateLimiter:
+    """Spaces out calls so no more than `rate` start each second
+
+    discord.py will back off once it is rate limited, this stops us getting there in the first place"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+class SlotReport:
+    """The outcome of dispatching a minute slot"""
+
+    __slots__ = ("slot", "due", "posted", "duration", "finished")
+
+    def __init__(self, slot: tuple, due: int, posted: int, duration: float):
+        self.slot = slot
+        self.due = due
+        self.posted = posted
+        self.duration = duration
+        self.finished = datetime.now()
+
+    def __str__(self):
+        return (
+            f"{self.slot[0]:02}:{self.slot[1]:02} - {self.posted}/{self.due} posted "
+            f"in {self.duration:.2f}s"
+        )
+
+
+class QOTDDispatcher:
+    """Sends QOTD for every guild due in a minute slot as one batch
+
+    The schedule is kept in a ScheduleStore, so the scheduler only has to wake the dispatcher once a minute
+    rather than running a job per guild, and nothing is lost across a restart"""
+
+    def __init__(
+        self,
+        bot,
+        post,
+        prepare=None,
+        claim=None,
+        workers: int = 8,
+        postsPerSecond: float = 10,
+        misfireGrace: int = 3600,
+        lead: int = 180,
+        storePath: str = "data/schedule.sqlite",
+    ):
+        self.bot = bot
+
+        self.post = post
+        """The coroutine that posts to a single guild, called with (guildConfig, questionLog)"""
+
+        self.prepare = prepare
+        """The coroutine that gets a guild's post ready ahead of time, called with (guildConfig)"""
+
+        self.claim = claim
+        """The coroutine that claims sends so only one process makes them, called with ({guild id: due time}, expiry)"""
+
+        self.lead = lead
+        """How many seconds before a slot its guilds are prepared"""
+
+        self.workers = workers
+        """How many guilds can be posted to at once"""
+
+        self.limiter = RateLimiter(postsPerSecond)
+
+        self.misfireGrace = misfireGrace
+        """How late, in seconds, a send can be and still go out"""
+
+        self.store = scheduleStore.ScheduleStore(storePath)
+
+        self.lastReport: (SlotReport, None) = None
+
+        self.unlogged: list = []
+        """questionLog rows whose insert failed, they are written along with the next slot's"""
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, guildID):
+        return guildID in self.store
+
+    def schedule(self, guildID, timeZone: str, sendTime: int) -> bool:
+        """Schedules a guild, leaving it alone if its send time hasn't changed
+        :return: True if the schedule was changed"""
+        entry = self.store.get(guildID)
+        if entry is not None and entry.timeZone == timeZone and entry.sendTime == sendTime:
+            return False
+        self.store.put(
+            scheduleStore.ScheduleEntry(
+                int(guildID),
+                timeZone,
+                sendTime,
+                timezones.fireTimes.next(timeZone, sendTime),
+                entry.lastRun if entry else None,
+            )
+        )
+        return True
+
+    def unschedule(self, guildID):
+        """Removes a guild from the schedule"""
+        self.store.remove(guildID)
+
+    def reconcile(self, configs: list):
+        """Brings the persisted schedule in line with the guilds table, only touching guilds that changed"""
+        self.store.load()
+        wanted = {config.guildID: config for config in configs if self.bot.runsGuild(config.guildID)}
+        stale = [guildID for guildID in self.store.entries if guildID not in wanted]
+        self.store.remove(*stale)
+
+        changed = 0
+        for config in wanted.values():
+            try:
+                changed += self.schedule(config.guildID, config.timeZone, config.sendTime)
+            except Exception as e:
+                log.critical(f"Error while scheduling QOTD for {config.guildID}: {e}")
+
+        # anything that was due while we were offline, and is too late to send, waits for its next slot
+        now = time()
+        expired = [e for e in self.store.due(now) if now - e.nextRun > self.misfireGrace]
+        self._advance(expired, now, ran=False)
+        log.info(
+            f"Reconciled schedule: {len(self.store)} guilds, {changed} changed, {len(stale)} removed, "
+            f"{len(expired)} missed sends skipped"
+        )
+
+    def _advance(self, entries: list, now: float, ran: bool = True):
+        """Moves entries on to their next send time"""
+        for entry in entries:
+            entry.nextRun = timezones.fireTimes.next(entry.timeZone, entry.sendTime, after=now)
+            if ran:
+                entry.lastRun = now
+        if entries:
+            self.store.put(*entries)
+
+    async def tick(self):
+        """Called by the scheduler every minute, dispatches any guilds due now
+        This includes sends missed during a restart that are still within the grace window"""
+        now = time()
+        if self.prepare is not None:
+            asyncio.create_task(self.prefetch(now + self.lead))
+        due = self.store.due(now)
+        if due:
+            local = datetime.fromtimestamp(now)
+            await self.runSlot((local.hour, local.minute), due, now)
+
+    async def prefetch(self, when: float):
+        """Prepares the posts for every guild due in the minute slot of a timestamp"""
+        entries = [e for e in self.store.dueAt(when) if self.bot.ownsGuild(e.guildID)]
+        if not entries:
+            return
+        configs = await self.bot.guildConfigs.getMany({entry.guildID for entry in entries})
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def worker(config):
+            async with semaphore:
+                try:
+                    return await self.prepare(config)
+                except Exception as e:
+                    log.debug(f"Failed to prepare post for {config.guildID}: {e}")
+
+        prepared = await asyncio.gather(*[worker(c) for c in configs.values() if c.enabled])
+        log.debug(f"Prepared {sum(1 for p in prepared if p)}/{len(entries)} posts for the next slot")
+
+    async def runSlot(self, slot: tuple, entries: list, now: float = None):
+        """Posts to every guild in a slot through a bounded pool of workers"""
+        start = perf_counter()
+        now = now or time()
+        for entry in [e for e in entries if not self.bot.runsGuild(e.guildID)]:
+            # the shards this process runs have changed, another process sends to this guild now
+            log.warning(f"{entry.guildID} is no longer on our shards, unscheduling")
+            self.unschedule(entry.guildID)
+        entries = [e for e in entries if self.bot.runsGuild(e.guildID)]
+
+        # guilds whose shard lease another process holds are left due, so if it dies we send them when we take over.
+        # Once they are too late to send they are moved on
+        waiting = [e for e in entries if not self.bot.ownsGuild(e.guildID)]
+        self._advance([e for e in waiting if now - e.nextRun > self.misfireGrace], now, ran=False)
+        entries = [e for e in entries if self.bot.ownsGuild(e.guildID)]
+
+        # a retried slot, or one rebuilt after a restart, can be too late to send
+        late = [e for e in entries if now - e.nextRun > self.misfireGrace]
+        if late:
+            log.warning(f"Skipping {len(late)} sends that are more than {self.misfireGrace}s late")
+            entries = [e for e in entries if now - e.nextRun <= self.misfireGrace]
+            self._advance(late, now, ran=False)
+        if not entries:
+            return None
+
+        sends = {entry.guildID: entry.nextRun for entry in entries}
+        lastRuns = {entry.guildID: entry.lastRun for entry in entries}
+        # move everyone on before awaiting anything, so an overlapping tick can't send twice
+        self._advance(entries, now)
+
+        try:
+            configs = await self.bot.guildConfigs.getMany(sends, raiseErrors=True)
+        except Exception as e:
+            # nothing has been sent, so put them back to be retried next tick
+            log.error(f"Failed to read guild configs, retrying slot next tick: {e}")
+            for entry in entries:
+                entry.nextRun, entry.lastRun = sends[entry.guildID], lastRuns[entry.guildID]
+            self.store.put(*entries)
+            return None
+        for guildID in sends.keys() - configs.keys():
+            if self.bot.get_guild(guildID) is None:
+                # for some reason this guild isnt in our DB anymore, and we cant access it
+                log.warning(f"{guildID} is no longer in the guilds table, unscheduling")
+                self.unschedule(guildID)
+            else:
+                log.warning(f"{guildID} is missing from the guilds table, skipping")
+
+        guildIDs = set(configs)
+        if self.claim is not None:
+            try:
+                guildIDs = await self.claim({g: sends[g] for g in guildIDs}, self.misfireGrace * 2)
+            except Exception as e:
+                # we hold these guilds' leases, so sending without a claim is very unlikely to double post
+                log.error(f"Failed to claim sends, sending anyway: {e}")
+            if len(guildIDs) < len(configs):
+                log.info(f"{len(configs) - len(guildIDs)} guilds were already sent to by another process")
+            configs = {guildID: configs[guildID] for guildID in guildIDs}
+
+        questionLog = []
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def worker(config):
+            async with semaphore:
+                await self.limiter.acquire()
+                try:
+                    return await self.post(config, questionLog)
+                except Exception as e:
+                    log.error(f"Failed to post to {config.guildID}: {e}")
+                    return False
+
+        results = await asyncio.gather(*[worker(c) for c in configs.values()])
+
+        rows, self.unlogged = self.unlogged + questionLog, []
+        if rows:
+            # one insert for the whole slot, rather than one per guild
+            try:
+                await self.bot.db.execute(
+                    "INSERT INTO QOTDBot.questionLog (questionID, guildID, posted, datePosted) VALUES "
+                    + ", ".join(["(%s, %s, TRUE, %s)"] * len(rows)),
+                    [value for row in rows for value in row],
+                    raiseErrors=True,
+                )
+            except Exception as e:
+                # these questions are posted and their decks have moved on, so they must not go missing
+                # from the history
+                log.error(f"Failed to log {len(rows)} posted questions, retrying with the next slot: {e}")
+                self.unlogged = rows + self.unlogged
+
+        self.lastReport = SlotReport(
+            slot, len(guildIDs), sum(1 for r in results if r), perf_counter() - start
+        )
+        log.info(f"Dispatched slot {self.lastReport}")
+        return self.lastReport
@@ -0,0 +1,205 @@
+import logging
+from collections import OrderedDict
+from time import monotonic
+
+from discord.ext import tasks
+
+from . import utilities
+
+log = utilities.getLog("guildConfig", logging.INFO)
+
+
+class GuildConfig:
+    """Represents a guild's row in QOTDBot.guilds"""
+
+    __slots__ = (
+        "guildID",
+        "qotdChannel",
+        "timeZone",
+        "sendTime",
+        "enabled",
+        "pinMessage",
+        "mentionRole",
+        "loadedAt",
+    )
+
+    def __init__(self, row: dict):
+        self.guildID: int = int(row["guildID"])
+        self.qotdChannel: (int, None) = _toID(row.get("qotdChannel"))
+        self.timeZone: (str, None) = row.get("timeZone")
+        self.sendTime: (int, None) = row.get("sendTime")
+        self.enabled: bool = bool(row.get("enabled"))
+        self.pinMessage: bool = bool(row.get("pinMessage"))
+        self.mentionRole: (int, None) = _toID(row.get("mentionRole"))
+
+        self.loadedAt: float = monotonic()
+        """When this record was read from the database"""
+
+    @property
+    def isSetup(self) -> bool:
+        """Has this guild set all the basic information needed for QOTD"""
+        return (
+            self.qotdChannel is not None
+            and self.timeZone is not None
+            and self.sendTime is not None
+        )
+
+
+def _toID(value) -> (int, None):
+    """The guilds table stores snowflakes as strings, this converts them back"""
+    if value is None:
+        return None
+    return int(value)
+
+
+class GuildConfigCache:
+    """A read-through cache of QOTDBot.guilds
+
+    Config commands update records in place after writing to the database,
+    so reads only hit the database when a guild is unknown or its record has expired"""
+
+    def __init__(self, db, maxSize: int = 50000, ttl: int = 21600, keep=None):
+        self.db = db
+
+        self.maxSize = maxSize
+        """The most guilds that will be held at once, on top of those bulk loaded. Bulk loaded guilds are never evicted"""
+
+        self.keep = keep
+        """Called with a guild id, decides which guilds are bulk loaded. Defaults to all of them"""
+
+        self.loaded = False
+        """Has a bulk load succeeded, so the cache holds every guild we keep"""
+        self._bulk: set = set()
+        """Ids of the guilds the last bulk load read"""
+
+        self.ttl = ttl
+        """How long, in seconds, a record is trusted before it is re-read"""
+
+        self.hits = 0
+        self.misses = 0
+
+        self._cache: "dict[int, GuildConfig]" = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        """Ids of the cached guilds that weren't bulk loaded, least recently used first"""
+
+        # records are re-read in bulk well before they expire, so the daily send never has to wait on the db
+        self.refreshTask = tasks.loop(seconds=ttl / 2)(self._refresh)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _touch(self, guildID: int):
+        if guildID in self._lru:
+            self._lru.move_to_end(guildID)
+
+    def _put(self, config: GuildConfig):
+        self._cache[config.guildID] = config
+        if config.guildID in self._bulk:
+            return
+        self._lru[config.guildID] = None
+        self._lru.move_to_end(config.guildID)
+        while len(self._lru) > self.maxSize:
+            guildID, _ = self._lru.popitem(last=False)
+            self._cache.pop(guildID, None)
+
+    def _drop(self, guildID: int):
+        self._cache.pop(guildID, None)
+        self._lru.pop(guildID, None)
+
+    async def loadAll(self) -> bool:
+        """Replaces the cache with every guild's config, read in one query
+        :return: False if the query failed, the cache is left as it was"""
+        try:
+            rows = await self.db.fetchAll("SELECT * FROM QOTDBot.guilds", raiseErrors=True)
+        except Exception as e:
+            log.error(f"Failed to load guild configs, keeping the cached ones: {e}")
+            return False
+        configs = [GuildConfig(row) for row in rows]
+        if self.keep is not None:
+            configs = [config for config in configs if self.keep(config.guildID)]
+
+        # replaced rather than merged, so guilds deleted from the table are dropped
+        self._cache = {config.guildID: config for config in configs}
+        self._bulk = set(self._cache)
+        self._lru = OrderedDict()
+        self.loaded = True
+        log.debug(f"Loaded {len(configs)} guild configs")
+        return True
+
+    async def _refresh(self):
+        if self.refreshTask.current_loop == 0:
+            # the startup load has only just happened
+            return
+        await self.loadAll()
+
+    def all(self) -> list:
+        """Every cached config, after a successful loadAll this is every guild we keep"""
+        return list(self._cache.values())
+
+    async def get(self, guildID, raiseErrors: bool = False) -> (GuildConfig, None):
+        """Gets a guild's config, only reading from the database if needed
+        :param raiseErrors: raise if the query fails, rather than returning None as if the guild wasn't there
+        :return: The config, or None if the guild is not in the guilds table"""
+        guildID = int(guildID)
+        config = self._cache.get(guildID)
+        if config is not None and monotonic() - config.loadedAt < self.ttl:
+            self._touch(guildID)
+            self.hits += 1
+            return config
+
+        self.misses += 1
+        row = await self.db.fetchOne(
+            "SELECT * FROM QOTDBot.guilds WHERE guildID = %s", (str(guildID),), raiseErrors=raiseErrors
+        )
+        if row is None:
+            self._drop(guildID)
+            return None
+        config = GuildConfig(row)
+        self._put(config)
+        return config
+
+    async def getMany(self, guildIDs, raiseErrors: bool = False) -> dict:
+        """Gets the configs of several guilds, reading any that aren't cached in one query
+        :param raiseErrors: raise if the query fails, rather than leaving out every guild it should have read
+        :return: A dict of guild id -> config, guilds not in the guilds table are left out"""
+        configs = {}
+        missing = []
+        now = monotonic()
+        for guildID in map(int, guildIDs):
+            config = self._cache.get(guildID)
+            if config is not None and now - config.loadedAt < self.ttl:
+                self._touch(guildID)
+                self.hits += 1
+                configs[guildID] = config
+            else:
+                missing.append(guildID)
+
+        if missing:
+            self.misses += len(missing)
+            rows = await self.db.fetchAll(
+                "SELECT * FROM QOTDBot.guilds WHERE guildID IN ("
+                + ", ".join(["%s"] * len(missing))
+                + ")",
+                [str(guildID) for guildID in missing],
+                raiseErrors=raiseErrors,
+            )
+            for row in rows:
+                config = GuildConfig(row)
+                self._put(config)
+                configs[config.guildID] = config
+        return configs
+
+    def update(self, guildID, **fields):
+        """Updates a cached config in place, call this after writing the same change to the database"""
+        config = self._cache.get(int(guildID))
+        if config is None:
+            # not cached, the next read will pick the change up
+            return
+        for key, value in fields.items():
+            if key in ("qotdChannel", "mentionRole"):
+                value = _toID(value)
+            setattr(config, key, value)
+
+    def invalidate(self, guildID):
+        """Drops a guild's config, forcing the next read to hit the database"""
+        self._drop(int(guildID))
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import socket
+from time import monotonic
+
+import redis.asyncio as aioredis
+
+from . import utilities
+
+log = utilities.getLog("leases", logging.INFO)
+
+# Every shard has a lease at qotd:lease:<shard count>:<shard id>, holding the id of the process allowed to send
+# its guilds' QOTD and close its guilds' polls. Several processes can run the same shards, for a rolling deploy or a
+# hot standby, but only the lease holder acts on them. Holders renew their leases well before they expire, so if one
+# dies the others take over once its leases lapse, and one that shuts down cleanly hands them over straight away
+
+_acquireScript = """
+local held = {}
+for i, key in ipairs(KEYS) do
+    local holder = redis.call('GET', key)
+    if holder == ARGV[1] then
+        redis.call('PEXPIRE', key, ARGV[2])
+        held[#held + 1] = i
+    elseif not holder then
+        redis.call('SET', key, ARGV[1], 'PX', ARGV[2])
+        held[#held + 1] = i
+    end
+end
+return held
+"""
+
+_releaseScript = """
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+    end
+end
+"""
+
+
+class LeaseManager:
+    """Holds the leases for as many of our shards as no other live process holds"""
+
+    def __init__(self, bot, ttl: float = 15, host: str = "localhost", port: int = 6379, db: int = 1):
+        self.bot = bot
+        self.ttl = ttl
+        """How long, in seconds, a lease lasts without being renewed. This is how long a takeover can take"""
+        self.renewInterval = ttl / 3
+
+        self.holderID = f"{socket.gethostname()}:{os.getpid()}"
+        """Identifies this process in the leases it holds"""
+
+        self.redis = aioredis.Redis(host=host, port=port, db=db, max_connections=2)
+        self._acquire = self.redis.register_script(_acquireScript)
+        self._release = self.redis.register_script(_releaseScript)
+
+        self.held: set = set()
+        """The shard ids we hold leases for, as of the last renewal"""
+        self.validUntil = 0.0
+        """monotonic() after which our leases may have lapsed, if they couldn't be renewed"""
+
+        self.ready = asyncio.Event()
+        """Set once we've first tried to take our leases"""
+
+        self.listeners: list = []
+        """Coroutines called with (gained, lost) shard ids whenever our leases change"""
+        self._task: asyncio.Task = None
+
+    def __len__(self):
+        return len(self.held)
+
+    @property
+    def shards(self) -> list:
+        """Every shard this process runs"""
+        if self.bot.shard_ids is not None:
+            return list(self.bot.shard_ids)
+        return list(range(self.bot.shard_count or 1))
+
+    def _key(self, shardID: int) -> str:
+        return f"qotd:lease:{self.bot.shard_count or 1}:{shardID}"
+
+    def holds(self, shardID: int) -> bool:
+        """Are we the only process that should act on this shard"""
+        return shardID in self.held and monotonic() < self.validUntil
+
+    def addListener(self, listener):
+        self.listeners.append(listener)
+
+    async def start(self):
+        """Takes whatever leases are free, then keeps them renewed"""
+        try:
+            await self.renew()
+        except Exception as e:
+            log.error(f"Failed to acquire shard leases: {e}")
+        self.ready.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._renewLoop())
+
+    async def _renewLoop(self):
+        while True:
+            await asyncio.sleep(self.renewInterval)
+            try:
+                await self.renew()
+            except Exception as e:
+                log.error(f"Failed to renew shard leases: {e}")
+                if self.held and monotonic() >= self.validUntil:
+                    # another process may have them by now
+                    await self._update(set())
+
+    async def renew(self):
+        """Renews the leases we hold, and takes any that have lapsed"""
+        shards = self.shards
+        started = monotonic()
+        result = await self._acquire(
+            keys=[self._key(shardID) for shardID in shards], args=[self.holderID, int(self.ttl * 1000)]
+        )
+        # measured from before the request, so we never think a lease is ours for longer than redis does
+        self.validUntil = started + self.ttl
+        await self._update({shards[i - 1] for i in result})
+
+    async def _update(self, held: set):
+        gained, lost = held - self.held, self.held - held
+        self.held = held
+        if not gained and not lost:
+            return
+        if gained:
+            log.info(f"Took leases for shards {sorted(gained)}")
+        if lost:
+            log.warning(f"Lost leases for shards {sorted(lost)}")
+        for listener in self.listeners:
+            try:
+                await listener(gained, lost)
+            except Exception as e:
+                log.error(f"Lease listener failed: {e}")
+
+    async def claim(self, sends: dict, expiry: int) -> set:
+        """
+        Claims sends, so a send can only ever be made once even if its shard's lease changes hands mid slot
+        :param sends: guild id -> the timestamp the send was due
+        :param expiry: how long, in seconds, to remember a claim
+        :return: the guild ids we claimed
+        """
+        guildIDs = list(sends)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for guildID in guildIDs:
+                pipe.set(f"qotd:sent:{guildID}:{int(sends[guildID])}", self.holderID, nx=True, ex=expiry)
+            results = await pipe.execute()
+        return {guildID for guildID, claimed in zip(guildIDs, results) if claimed}
+
+    async def close(self):
+        """Hands our leases back, so another process can take over without waiting for them to expire"""
+        if self._task:
+            self._task.cancel()
+        try:
+            if self.held:
+                await self._release(keys=[self._key(shardID) for shardID in self.held], args=[self.holderID])
+                log.info(f"Released leases for shards {sorted(self.held)}")
+            self.held = set()
+        except Exception as e:
+            log.error(f"Failed to release shard leases: {e}")
+        await self.redis.close()
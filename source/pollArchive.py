@@ -0,0 +1,64 @@
+import logging
+import sys
+from array import array
+from datetime import datetime
+
+from . import utilities, pollData
+from .pollData import PollData
+
+log = utilities.getLog("pollArchive", logging.INFO)
+
+
+def _packCounts(counts: list) -> bytes:
+    counts = array("I", counts)
+    if sys.byteorder == "big":
+        counts.byteswap()
+    return counts.tobytes()
+
+
+class PollArchive:
+    """Keeps the results of closed polls in mysql, so they can be dropped from redis
+
+    Each poll is one row, its metadata encoded by pollData and its per option counts packed as little
+    endian unsigned 32 bit ints"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def setup(self):
+        """Makes sure the archive table exists"""
+        await self.db.execute(
+            "CREATE TABLE IF NOT EXISTS QOTDBot.pollArchive ("
+            "messageID BIGINT UNSIGNED NOT NULL PRIMARY KEY, "
+            "guildID VARCHAR(32), "
+            "channelID BIGINT UNSIGNED NOT NULL, "
+            "authorID BIGINT UNSIGNED NOT NULL, "
+            "totalVotes INT UNSIGNED NOT NULL DEFAULT 0, "
+            "counts VARBINARY(255) NOT NULL, "
+            "poll BLOB NOT NULL, "
+            "closedAt DATETIME NOT NULL, "
+            "INDEX (guildID))"
+        )
+
+    async def archive(self, poll: PollData, counts: list, guildID=None):
+        """Records a closed poll's results
+        :raises: if the row couldn't be written"""
+        counts = list(counts or [0] * len(poll.options))
+        await self.db.execute(
+            "INSERT INTO QOTDBot.pollArchive "
+            "(messageID, guildID, channelID, authorID, totalVotes, counts, poll, closedAt) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE "
+            "totalVotes = VALUES(totalVotes), counts = VALUES(counts), closedAt = VALUES(closedAt)",
+            (
+                int(poll.message_id),
+                str(guildID) if guildID else None,
+                int(poll.channel_id),
+                int(poll.author_id),
+                sum(counts),
+                _packCounts(counts),
+                pollData.encode(poll, includeVoters=False),
+                datetime.now(),
+            ),
+            raiseErrors=True,
+        )
+        log.debug(f"Archived poll {poll.message_id}")
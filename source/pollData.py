@@ -0,0 +1,244 @@
+import bisect
+import struct
+import sys
+import typing
+import zlib
+from array import array
+from datetime import datetime
+
+
+class VoterSet:
+    """The user ids that voted for an option, as a sorted array of unsigned 64 bit ints
+
+    Lookups are a binary search, and each voter costs 8 bytes rather than a python int in a list"""
+
+    __slots__ = ("ids",)
+
+    def __init__(self, ids=()):
+        self.ids = array("Q", sorted(set(ids)))
+
+    @classmethod
+    def fromArray(cls, ids: array) -> "VoterSet":
+        voters = cls()
+        if any(ids[i] >= ids[i + 1] for i in range(len(ids) - 1)):
+            ids = array("Q", sorted(set(ids)))
+        voters.ids = ids
+        return voters
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, userID):
+        i = bisect.bisect_left(self.ids, userID)
+        return i < len(self.ids) and self.ids[i] == userID
+
+    def discard(self, userID: int) -> bool:
+        """:return: False if they hadn't voted"""
+        i = bisect.bisect_left(self.ids, userID)
+        if i < len(self.ids) and self.ids[i] == userID:
+            del self.ids[i]
+            return True
+        return False
+
+
+class PollData:
+    """Represents a poll"""
+
+    __slots__ = (
+        "title",
+        "options",
+        "expiry_time",
+        "single_vote",
+        "channel_id",
+        "author_id",
+        "message_id",
+        "footer_text",
+        "footer_icon",
+        "guild_id",
+        "_choices",
+    )
+
+    def __init__(
+        self,
+        author_id,
+        title="",
+        poll_options=None,
+        expiry_time=None,
+        single_vote=False,
+    ):
+        if poll_options is None:
+            poll_options = []
+        self.title = title
+        self.options: typing.List[Option] = poll_options
+        self.expiry_time: datetime = expiry_time
+        self.single_vote: bool = single_vote
+
+        self.channel_id: int = 0
+        self.author_id: int = author_id
+        self.message_id: int = 0
+        self.guild_id: int = 0
+        """0 for polls created before this was stored"""
+
+        self.footer_text: str = ""
+        self.footer_icon: str = ""
+        """The poll message's footer, so it can be redrawn without fetching the message"""
+
+        self._choices: dict = None
+
+    @property
+    def total_votes(self) -> int:
+        return sum(option.votes for option in self.options)
+
+    @property
+    def choices(self) -> dict:
+        """User id -> the index of the option they voted for, for single vote polls
+        If a user somehow voted for several options, the first one wins"""
+        if self._choices is None:
+            self._choices = {}
+            for index, option in enumerate(self.options):
+                for userID in option.voters:
+                    self._choices.setdefault(userID, index)
+        return self._choices
+
+    def dedupe(self):
+        """Makes sure no one has voted for more than one option of a single vote poll"""
+        if not self.single_vote:
+            return
+        for userID, index in self.choices.items():
+            for i, option in enumerate(self.options):
+                if i != index and option.voters.discard(userID):
+                    option.votes -= 1
+
+
+class Option:
+    """Represents a poll option"""
+
+    __slots__ = ("text", "emoji", "voters", "votes", "style")
+
+    def __init__(self, option_text="Unset", emoji="❓"):
+        super().__init__()
+        self.text = option_text
+        self.emoji = emoji
+        self.voters: VoterSet = VoterSet()
+        """Only populated when a poll is read along with its voters"""
+        self.votes: int = 0
+        self.style: int = 1
+
+
+# Encoded polls start with a version byte and a flags byte, the rest is zlib compressed if the flag is set.
+# Everything is little endian, strings are utf-8 prefixed with their length in bytes, and each option's
+# voters are a count followed by packed unsigned 64 bit ints
+
+version = 3
+"""Version 2 added the footer after the title, version 3 added the guild id after the footer"""
+compressThreshold = 1024
+"""Encoded polls larger than this, in bytes, are compressed"""
+
+_compressed = 0x01
+_header = struct.Struct("<BB")
+_poll = struct.Struct("<QQQdBH")
+_option = struct.Struct("<BI")
+_guild = struct.Struct("<Q")
+
+
+def _packString(text: str, lengthFormat: str = "<H") -> bytes:
+    encoded = text.encode("utf-8")
+    return struct.pack(lengthFormat, len(encoded)) + encoded
+
+
+def _unpackString(blob: memoryview, offset: int, lengthFormat: str = "<H") -> (str, int):
+    (length,) = struct.unpack_from(lengthFormat, blob, offset)
+    offset += struct.calcsize(lengthFormat)
+    return bytes(blob[offset: offset + length]).decode("utf-8"), offset + length
+
+
+def _packVoters(voters) -> bytes:
+    voters = array("Q", voters.ids if isinstance(voters, VoterSet) else voters)
+    if sys.byteorder == "big":
+        voters.byteswap()
+    return voters.tobytes()
+
+
+def encode(poll: PollData, includeVoters: bool = True) -> bytes:
+    """Encodes a poll, and optionally its voters, into bytes"""
+    parts = [
+        _poll.pack(
+            int(poll.message_id),
+            int(poll.channel_id),
+            int(poll.author_id),
+            poll.expiry_time.timestamp() if poll.expiry_time else 0.0,
+            int(bool(poll.single_vote)),
+            len(poll.options),
+        ),
+        _packString(poll.title or ""),
+        _packString(getattr(poll, "footer_text", "") or ""),
+        _packString(getattr(poll, "footer_icon", "") or ""),
+        _guild.pack(int(getattr(poll, "guild_id", 0) or 0)),
+    ]
+    for option in poll.options:
+        voters = option.voters if includeVoters else ()
+        parts.append(_packString(option.text))
+        parts.append(_packString(option.emoji, "<B"))
+        parts.append(_option.pack(option.style, len(voters)))
+        parts.append(_packVoters(voters))
+    body = b"".join(parts)
+
+    flags = 0
+    if len(body) > compressThreshold:
+        compressed = zlib.compress(body, 6)
+        if len(compressed) < len(body):
+            body, flags = compressed, _compressed
+    return _header.pack(version, flags) + body
+
+
+def decode(blob: bytes) -> PollData:
+    """Decodes a poll encoded by encode(), vote counts are taken from the voters it was encoded with"""
+    _version, flags = _header.unpack_from(blob)
+    if not 1 <= _version <= version:
+        raise ValueError(f"Unknown poll encoding version {_version}")
+    body = blob[_header.size:]
+    if flags & _compressed:
+        body = zlib.decompress(body)
+    body = memoryview(body)
+
+    messageID, channelID, authorID, expiry, singleVote, optionCount = _poll.unpack_from(body)
+    title, offset = _unpackString(body, _poll.size)
+    footerText = footerIcon = ""
+    if _version >= 2:
+        footerText, offset = _unpackString(body, offset)
+        footerIcon, offset = _unpackString(body, offset)
+    guildID = 0
+    if _version >= 3:
+        (guildID,) = _guild.unpack_from(body, offset)
+        offset += _guild.size
+    poll = PollData(
+        authorID,
+        title=title,
+        expiry_time=datetime.fromtimestamp(expiry) if expiry else None,
+        single_vote=bool(singleVote),
+    )
+    poll.message_id = messageID
+    poll.channel_id = channelID
+    poll.footer_text = footerText
+    poll.footer_icon = footerIcon
+    poll.guild_id = guildID
+
+    for _ in range(optionCount):
+        text, offset = _unpackString(body, offset)
+        emoji, offset = _unpackString(body, offset, "<B")
+        style, voterCount = _option.unpack_from(body, offset)
+        offset += _option.size
+        option = Option(option_text=text, emoji=emoji)
+        option.style = style
+        voters = array("Q")
+        voters.frombytes(body[offset: offset + voterCount * 8])
+        if sys.byteorder == "big":
+            voters.byteswap()
+        option.voters = VoterSet.fromArray(voters)
+        option.votes = len(option.voters)
+        offset += voterCount * 8
+        poll.options.append(option)
+    return poll
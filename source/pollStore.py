@@ -0,0 +1,573 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from time import monotonic, time
+
+import jsonpickle
+import redis.asyncio as aioredis
+
+from . import utilities, pollData
+from .pollData import PollData, Option
+
+log = utilities.getLog("pollStore", logging.INFO)
+
+
+# Each poll is a hash of its encoded metadata at poll:<message id>, one set of user ids per option at
+# poll:<message id>:votes:<option index>, and for single vote polls a user id -> option index hash at
+# poll:<message id>:choice. Votes are only ever changed by the scripts below, so concurrent clicks, from
+# any number of processes, can't lose each other's votes
+
+_voteScript = """
+local base = KEYS[1]
+local user = ARGV[1]
+local option = tonumber(ARGV[2])
+local meta = redis.call('HMGET', base, 'optionCount', 'singleVote', 'idleTTL')
+if not meta[1] then
+    return false
+end
+local count = tonumber(meta[1])
+if option < 0 or option >= count then
+    return false
+end
+local votes = base .. ':votes:'
+if redis.call('SREM', votes .. option, user) == 1 then
+    if meta[2] == '1' then
+        redis.call('HDEL', base .. ':choice', user)
+    end
+else
+    redis.call('SADD', votes .. option, user)
+    if meta[2] == '1' then
+        local previous = redis.call('HGET', base .. ':choice', user)
+        if previous then
+            redis.call('SREM', votes .. previous, user)
+        end
+        redis.call('HSET', base .. ':choice', user, option)
+    end
+end
+-- polls without an expiry live for idleTTL after their last vote, everything else keeps the poll's ttl
+local ttl = redis.call('TTL', base)
+local idle = tonumber(meta[3] or '0')
+if idle and idle > 0 then
+    redis.call('EXPIRE', base, idle)
+    ttl = idle
+end
+-- every key of the poll shares its ttl, or options nobody has voted on lately would expire on their own
+if ttl > 0 then
+    for i = 0, count - 1 do
+        redis.call('EXPIRE', votes .. i, ttl)
+    end
+    redis.call('EXPIRE', base .. ':choice', ttl)
+end
+local counts = {}
+for i = 0, count - 1 do
+    counts[i + 1] = redis.call('SCARD', votes .. i)
+end
+return counts
+"""
+
+_countsScript = """
+local base = KEYS[1]
+local count = redis.call('HGET', base, 'optionCount')
+if not count then
+    return false
+end
+local counts = {}
+for i = 0, tonumber(count) - 1 do
+    counts[i + 1] = redis.call('SCARD', base .. ':votes:' .. i)
+end
+return counts
+"""
+
+_removeOptionScript = """
+local base = KEYS[1]
+local option = tonumber(ARGV[1])
+local count = tonumber(redis.call('HGET', base, 'optionCount'))
+if not count or option < 0 or option >= count then
+    return 0
+end
+local votes = base .. ':votes:'
+redis.call('DEL', votes .. option)
+for i = option + 1, count - 1 do
+    if redis.call('EXISTS', votes .. i) == 1 then
+        redis.call('RENAME', votes .. i, votes .. (i - 1))
+    end
+end
+local choice = base .. ':choice'
+local choices = redis.call('HGETALL', choice)
+for i = 1, #choices, 2 do
+    local index = tonumber(choices[i + 1])
+    if index == option then
+        redis.call('HDEL', choice, choices[i])
+    elseif index > option then
+        redis.call('HSET', choice, choices[i], index - 1)
+    end
+end
+redis.call('HSET', base, 'optionCount', count - 1)
+return 1
+"""
+
+_saveScript = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+
+idleTTL = 30 * 86400
+"""How long, in seconds, a poll without an expiry is kept in redis after its last vote"""
+
+closedGrace = 86400
+"""How long, in seconds, a poll with an expiry is kept in redis after it should have closed"""
+
+_expiryKey = "polls:expiry"
+"""A sorted set of the message ids of polls that close, scored by when they close"""
+
+
+def _key(messageID) -> str:
+    return f"poll:{int(messageID)}"
+
+
+def _decodeLegacy(raw) -> PollData:
+    """Decodes a poll stored as a single jsonpickle blob"""
+    data = jsonpickle.decode(raw)
+    if isinstance(data, PollData):
+        return data
+
+    # older polls were stored as a dict of PollData's attributes
+    poll = PollData(0)
+    for key in data.keys():
+        if hasattr(poll, key):
+            poll.__setattr__(key, data.get(key))
+    return poll
+
+
+def _toHash(poll: PollData) -> dict:
+    # the scripts need to read these two without decoding the poll
+    return {
+        "data": pollData.encode(poll, includeVoters=False),
+        "singleVote": int(bool(poll.single_vote)),
+        "optionCount": len(poll.options),
+        "idleTTL": 0 if poll.expiry_time else idleTTL,
+    }
+
+
+def _hashArgs(fields: dict) -> list:
+    """Flattens a hash's fields into the field, value pairs HSET takes"""
+    return [item for pair in fields.items() for item in pair]
+
+
+def _fromHash(data: dict) -> PollData:
+    if b"data" in data:
+        return pollData.decode(data[b"data"])
+
+    # polls stored before the binary encoding kept each attribute in its own field
+    data = {k.decode(): v.decode() for k, v in data.items()}
+    poll = PollData(int(data["authorID"]), title=data["title"], single_vote=data["singleVote"] == "1")
+    poll.channel_id = int(data["channelID"])
+    poll.message_id = int(data["messageID"])
+    if data["expiry"]:
+        poll.expiry_time = datetime.fromtimestamp(float(data["expiry"]))
+    for text, emoji, style in json.loads(data["options"]):
+        option = Option(option_text=text, emoji=emoji)
+        option.style = style
+        poll.options.append(option)
+    return poll
+
+
+_invalidateChannel = "polls:invalidate"
+"""Processes announce polls they have created, changed or deleted here, so others can keep up"""
+
+
+class PollCache:
+    """Live polls, kept in memory so polls being used a lot aren't read from redis over and over
+
+    Least recently used polls are evicted past maxSize, and any poll not used for maxIdle seconds is
+    evicted when evict() is called. Polls waiting to be written are never evicted"""
+
+    def __init__(self, maxSize: int = 2000, maxIdle: float = 900):
+        self.maxSize = maxSize
+        self.maxIdle = maxIdle
+        self._polls: "OrderedDict[int, PollData]" = OrderedDict()
+        self._lastUsed: dict = {}
+        self.dirty: set = set()
+        """Message ids of polls changed in memory, but not yet written to redis"""
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._polls)
+
+    def __contains__(self, messageID):
+        return int(messageID) in self._polls
+
+    def get(self, messageID) -> (PollData, None):
+        messageID = int(messageID)
+        poll = self._polls.get(messageID)
+        if poll is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._polls.move_to_end(messageID)
+        self._lastUsed[messageID] = monotonic()
+        return poll
+
+    def put(self, poll: PollData, dirty: bool = False):
+        messageID = int(poll.message_id)
+        self._polls[messageID] = poll
+        self._polls.move_to_end(messageID)
+        self._lastUsed[messageID] = monotonic()
+        if dirty:
+            self.dirty.add(messageID)
+        if len(self._polls) > self.maxSize:
+            for oldest in list(self._polls)[: len(self._polls) - self.maxSize]:
+                if oldest not in self.dirty:
+                    self.invalidate(oldest)
+
+    def invalidate(self, messageID):
+        messageID = int(messageID)
+        self._polls.pop(messageID, None)
+        self._lastUsed.pop(messageID, None)
+        self.dirty.discard(messageID)
+
+    def invalidateClean(self):
+        """Drops every poll that isn't waiting to be written"""
+        for messageID in [m for m in self._polls if m not in self.dirty]:
+            self.invalidate(messageID)
+
+    def takeDirty(self) -> list:
+        """Every poll waiting to be written, clearing them as dirty"""
+        polls = [self._polls[m] for m in self.dirty if m in self._polls]
+        self.dirty.clear()
+        return polls
+
+    def evict(self):
+        """Drops polls that haven't been used recently"""
+        cutoff = monotonic() - self.maxIdle
+        for messageID in [m for m, t in self._lastUsed.items() if t < cutoff and m not in self.dirty]:
+            self.invalidate(messageID)
+
+
+class PollStore:
+    """Where polls live, on an asyncio redis client with its own connection pool
+
+    Nothing here blocks the event loop or goes through an executor, and bulk reads are pipelined"""
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 1,
+        maxConnections: int = None,
+        flushInterval: float = 1,
+    ):
+        if maxConnections is None:
+            # the cluster launcher splits connections between processes
+            maxConnections = int(os.environ.get("QOTD_REDIS_POOL", 32))
+        self.pool = aioredis.BlockingConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            max_connections=maxConnections,
+            timeout=5,
+            socket_keepalive=True,
+            health_check_interval=30,
+        )
+        self.redis = aioredis.Redis(connection_pool=self.pool)
+        self._vote = self.redis.register_script(_voteScript)
+        self._counts = self.redis.register_script(_countsScript)
+        self._removeOption = self.redis.register_script(_removeOptionScript)
+        self._save = self.redis.register_script(_saveScript)
+
+        self.cache = PollCache()
+        self.flushInterval = flushInterval
+        """How often, in seconds, changed polls are written to redis"""
+        self.instanceID = f"{os.getpid()}-{id(self)}"
+        """Identifies this process's invalidation messages, so it can ignore its own"""
+        self.active: set = set()
+        """Message ids of every stored poll, so anything can check if a message is a poll for free"""
+        self._tasks = []
+
+    def __contains__(self, messageID):
+        return int(messageID) in self.active
+
+    async def loadIndex(self):
+        """Reads the message id of every stored poll into memory"""
+        self.active = set(await self.ids())
+        log.info(f"Indexed {len(self.active)} active polls")
+
+    async def start(self):
+        """Starts writing changed polls, and listening for polls changed by other processes"""
+        self._tasks = [
+            asyncio.create_task(self._flushLoop()),
+            asyncio.create_task(self._listen()),
+        ]
+
+    async def _flushLoop(self):
+        while True:
+            await asyncio.sleep(self.flushInterval)
+            try:
+                await self.flush()
+                self.cache.evict()
+            except Exception as e:
+                log.error(f"Failed to write polls: {e}")
+
+    async def _listen(self):
+        backoff = 1
+        reconnecting = False
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(_invalidateChannel)
+                if reconnecting:
+                    # anything announced while we were away was missed, so forget what we can't trust
+                    self.cache.invalidateClean()
+                    await self.loadIndex()
+                    log.info("Reconnected to the poll invalidation channel")
+                backoff = 1
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._onAnnouncement(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Lost the poll invalidation channel, reconnecting in {backoff}s: {e}")
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            reconnecting = True
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def _onAnnouncement(self, data: bytes):
+        instanceID, action, messageID = data.decode().split(":")
+        if instanceID == self.instanceID:
+            return
+        messageID = int(messageID)
+        if action == "created":
+            self.active.add(messageID)
+        elif action == "deleted":
+            self.active.discard(messageID)
+            self.cache.invalidate(messageID)
+        elif messageID not in self.cache.dirty:
+            self.cache.invalidate(messageID)
+
+    def _message(self, action: str, messageID) -> str:
+        return f"{self.instanceID}:{action}:{int(messageID)}"
+
+    async def _announce(self, *messageIDs, action: str = "changed"):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for messageID in messageIDs:
+                pipe.publish(_invalidateChannel, self._message(action, messageID))
+            await pipe.execute()
+
+    async def flush(self):
+        """Writes every poll changed in memory to redis"""
+        polls = self.cache.takeDirty()
+        if not polls:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for poll in polls:
+                await self._save(keys=[_key(poll.message_id)], args=_hashArgs(_toHash(poll)), client=pipe)
+            results = await pipe.execute()
+        written = []
+        for poll, saved in zip(polls, results):
+            if saved:
+                written.append(poll.message_id)
+            else:
+                # deleted by another process since it was read, don't bring it back
+                self.cache.invalidate(poll.message_id)
+                self.active.discard(int(poll.message_id))
+        if written:
+            await self._announce(*written)
+        log.debug(f"Wrote {len(written)}/{len(polls)} changed polls")
+
+    async def ping(self):
+        return await self.redis.ping()
+
+    async def create(self, poll: PollData, voters: dict = None):
+        """
+        Stores a new poll
+        :param voters: option index -> user ids, for polls that already have votes
+        """
+        key = _key(poll.message_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=_toHash(poll))
+            if poll.expiry_time:
+                pipe.zadd(_expiryKey, {int(poll.message_id): poll.expiry_time.timestamp()})
+            for index, users in (voters or {}).items():
+                if len(users):
+                    pipe.sadd(f"{key}:votes:{index}", *users)
+            if voters and poll.single_vote and poll.choices:
+                pipe.hset(f"{key}:choice", mapping=poll.choices)
+            # nothing lives in redis forever, closed polls are archived in mysql
+            keys = [key, f"{key}:choice"] + [f"{key}:votes:{i}" for i in range(len(poll.options))]
+            # overdue polls, like migrated ones, still get the grace period to be closed and archived in
+            expireAt = int(max(poll.expiry_time.timestamp(), time()) + closedGrace) if poll.expiry_time else None
+            for k in keys:
+                if poll.expiry_time:
+                    pipe.expireat(k, expireAt)
+                else:
+                    pipe.expire(k, idleTTL)
+            pipe.publish(_invalidateChannel, self._message("created", poll.message_id))
+            await pipe.execute()
+        self.cache.put(poll)
+        self.active.add(int(poll.message_id))
+
+    async def saveMeta(self, poll: PollData):
+        """Saves a poll's title and options, leaving its votes alone
+        The poll is written behind by the flush loop, except its option count, which the vote script checks
+        votes against, so votes for a new option are accepted straight away"""
+        await self._save(keys=[_key(poll.message_id)], args=["optionCount", len(poll.options)])
+        self.cache.put(poll, dirty=True)
+
+    async def _migrate(self, messageID) -> (PollData, None):
+        """Moves a poll stored as a jsonpickle blob into the current layout"""
+        raw = await self.redis.get(int(messageID))
+        if raw is None:
+            return None
+        legacy = _decodeLegacy(raw)
+        legacy.message_id = int(messageID)
+        # a round trip through the codec gives the poll every attribute the current classes have
+        poll = pollData.decode(pollData.encode(legacy))
+        poll.dedupe()
+        voters = {i: option.voters for i, option in enumerate(poll.options)}
+        await self.create(poll, voters)
+        await self.redis.delete(int(messageID))
+        for option in poll.options:
+            option.votes = len(option.voters)
+            option.voters = pollData.VoterSet()
+        poll._choices = None
+        log.debug(f"Migrated poll {messageID}")
+        return poll
+
+    async def get(self, messageID) -> (PollData, None):
+        """Gets a poll by its message id, with each option's vote count but not its voters"""
+        poll = self.cache.get(messageID)
+        if poll is None:
+            data = await self.redis.hgetall(_key(messageID))
+            if not data:
+                return await self._migrate(messageID)
+            poll = _fromHash(data)
+            self.cache.put(poll)
+        # votes can come from any process, so counts are always read from redis
+        counts = await self.counts(messageID) or []
+        for option, count in zip(poll.options, counts):
+            option.votes = count
+        return poll
+
+    async def getMany(self, messageIDs: list) -> list:
+        """Gets several polls' metadata in one round trip, missing polls are None
+        Vote counts are not read"""
+        if not messageIDs:
+            return []
+        polls = {int(m): self.cache.get(m) for m in messageIDs}
+        missing = [m for m, poll in polls.items() if poll is None]
+        if missing:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for messageID in missing:
+                    pipe.hgetall(_key(messageID))
+                results = await pipe.execute()
+            for messageID, data in zip(missing, results):
+                try:
+                    polls[messageID] = _fromHash(data) if data else await self._migrate(messageID)
+                    if polls[messageID] is not None:
+                        self.cache.put(polls[messageID])
+                except Exception as e:
+                    log.error(f"Unable to decode poll {messageID}: {e}")
+        return [polls[int(m)] for m in messageIDs]
+
+    async def vote(self, messageID, userID: int, option: int) -> (list, None):
+        """
+        Toggles a user's vote for an option, moving it if the poll is single vote
+        :return: every option's vote count, or None if there is no such poll or option
+        """
+        counts = await self._vote(keys=[_key(messageID)], args=[int(userID), int(option)])
+        return counts or None
+
+    async def counts(self, messageID) -> (list, None):
+        """
+        Reads every option's vote count
+        :return: the counts, or None if there is no such poll
+        """
+        return await self._counts(keys=[_key(messageID)])
+
+    async def removeOption(self, messageID, option: int) -> bool:
+        """Removes an option, and its votes, from a poll"""
+        removed = bool(await self._removeOption(keys=[_key(messageID)], args=[int(option)]))
+        await self._announce(messageID)
+        return removed
+
+    async def delete(self, messageID):
+        self.cache.invalidate(messageID)
+        self.active.discard(int(messageID))
+        key = _key(messageID)
+        count = await self.redis.hget(key, "optionCount")
+        keys = [key, f"{key}:choice", int(messageID)]
+        keys += [f"{key}:votes:{i}" for i in range(int(count or 0))]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(*keys)
+            pipe.zrem(_expiryKey, int(messageID))
+            pipe.publish(_invalidateChannel, self._message("deleted", messageID))
+            await pipe.execute()
+
+    async def expired(self, now: float) -> list:
+        """The message ids of every poll due to close by now"""
+        return [int(m) for m in await self.redis.zrangebyscore(_expiryKey, "-inf", now)]
+
+    async def nextExpiry(self, after: float) -> (tuple, None):
+        """
+        The next poll due to close after a timestamp
+        :return: (unix timestamp, message id) or None if no more polls close
+        """
+        result = await self.redis.zrangebyscore(_expiryKey, f"({after}", "+inf", start=0, num=1, withscores=True)
+        if not result:
+            return None
+        messageID, when = result[0]
+        return when, int(messageID)
+
+    async def forgetExpiry(self, messageID):
+        """Stops a poll being returned by expired(), without deleting it"""
+        await self.redis.zrem(_expiryKey, int(messageID))
+
+    async def indexExpiries(self):
+        """Adds any stored polls missing from the expiry index, migrating old polls on the way"""
+        ids = await self.ids()
+        indexed = 0
+        for i in range(0, len(ids), 500):
+            polls = [p for p in await self.getMany(ids[i: i + 500]) if p and p.expiry_time]
+            if polls:
+                indexed += await self.redis.zadd(
+                    _expiryKey, {p.message_id: p.expiry_time.timestamp() for p in polls}
+                )
+        if indexed:
+            log.info(f"Added {indexed} polls to the expiry index")
+
+    async def ids(self, batchSize: int = 500) -> list:
+        """Every stored poll's message id, read with SCAN so redis isn't blocked by KEYS"""
+        found = set()
+        async for key in self.redis.scan_iter(count=batchSize):
+            parts = key.split(b":")
+            if len(parts) == 1 and parts[0].isdigit():
+                # not yet migrated
+                found.add(int(parts[0]))
+            elif len(parts) == 2 and parts[0] == b"poll":
+                found.add(int(parts[1]))
+        return list(found)
+
+    async def close(self):
+        """Writes anything still waiting, then disconnects"""
+        for task in self._tasks:
+            task.cancel()
+        try:
+            await self.flush()
+        except Exception as e:
+            log.error(f"Failed to write polls on shutdown: {e}")
+        await self.redis.close()
+        await self.pool.disconnect()
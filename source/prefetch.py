@@ -0,0 +1,63 @@
+import logging
+from collections import OrderedDict
+from time import monotonic
+
+import discord
+
+from . import utilities
+
+log = utilities.getLog("prefetch", logging.INFO)
+
+
+class PreparedPost:
+    """A guild's next question, resolved and ready to send"""
+
+    __slots__ = ("guildID", "questionID", "isCustom", "embed", "preparedAt")
+
+    def __init__(self, guildID: int, questionID: int, isCustom: bool, embed: discord.Embed):
+        self.guildID = guildID
+        self.questionID = questionID
+        self.isCustom = isCustom
+        self.embed = embed
+        self.preparedAt = monotonic()
+
+
+class PrefetchCache:
+    """A small, bounded, cache of prepared posts, filled shortly before each guild's slot
+
+    Entries are only used once, and are dropped if the guild's questions change before they are sent"""
+
+    def __init__(self, maxSize: int = 5000, maxAge: float = 900):
+        self.maxSize = maxSize
+        self.maxAge = maxAge
+        """How long, in seconds, a prepared post is trusted for"""
+
+        self._posts: "OrderedDict[int, PreparedPost]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._posts)
+
+    def put(self, post: PreparedPost):
+        self._posts[post.guildID] = post
+        self._posts.move_to_end(post.guildID)
+        while len(self._posts) > self.maxSize:
+            self._posts.popitem(last=False)
+
+    def take(self, guildID) -> (PreparedPost, None):
+        """Removes and returns a guild's prepared post, if it has a fresh one"""
+        post = self._posts.pop(int(guildID), None)
+        if post is None or monotonic() - post.preparedAt > self.maxAge:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return post
+
+    def invalidate(self, guildID):
+        """Drops a guild's prepared post"""
+        self._posts.pop(int(guildID), None)
+
+    def clear(self):
+        """Drops every prepared post"""
+        self._posts.clear()
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import random
+import sys
+from array import array
+from collections import defaultdict
+
+from . import utilities
+
+log = utilities.getLog("questionDeck", logging.INFO)
+
+# question ids are stored as little endian unsigned 32 bit ints
+_typeCode = "I"
+
+
+def _pack(ids: array) -> bytes:
+    if sys.byteorder == "big":
+        ids = array(_typeCode, ids)
+        ids.byteswap()
+    return ids.tobytes()
+
+
+def _unpack(blob: bytes) -> array:
+    ids = array(_typeCode)
+    ids.frombytes(blob or b"")
+    if sys.byteorder == "big":
+        ids.byteswap()
+    return ids
+
+
+def _shuffled(ids) -> array:
+    ids = list(ids)
+    random.shuffle(ids)
+    return array(_typeCode, ids)
+
+
+class Deck:
+    """A guild's shuffled, yet to be asked, questions
+
+    Custom questions are always asked before default questions, so each has its own pile and cursor"""
+
+    __slots__ = (
+        "guildID",
+        "custom",
+        "customCursor",
+        "default",
+        "defaultCursor",
+        "defaultHighWater",
+    )
+
+    def __init__(self, guildID: int, row: dict = None):
+        self.guildID = guildID
+        self.custom: array = _unpack(row["customDeck"]) if row else array(_typeCode)
+        self.customCursor: int = row["customCursor"] if row else 0
+        self.default: array = _unpack(row["defaultDeck"]) if row else array(_typeCode)
+        self.defaultCursor: int = row["defaultCursor"] if row else 0
+        self.defaultHighWater: int = row["defaultHighWater"] if row else 0
+        """The largest default question id this deck has been dealt"""
+
+    @property
+    def remainingCustom(self) -> int:
+        return len(self.custom) - self.customCursor
+
+    @property
+    def remainingDefault(self) -> int:
+        return len(self.default) - self.defaultCursor
+
+    def next(self) -> (tuple, None):
+        """
+        The next question in the deck
+        :return: (questionID, isCustom) or None if the deck is empty
+        """
+        if self.remainingCustom > 0:
+            return self.custom[self.customCursor], True
+        if self.remainingDefault > 0:
+            return self.default[self.defaultCursor], False
+        return None
+
+    def advance(self, questionID: int) -> bool:
+        """Moves past a question, if it is the next one in the deck"""
+        if self.remainingCustom > 0:
+            if self.custom[self.customCursor] == questionID:
+                self.customCursor += 1
+                return True
+        elif self.remainingDefault > 0:
+            if self.default[self.defaultCursor] == questionID:
+                self.defaultCursor += 1
+                return True
+        return False
+
+    def insertCustom(self, questionID: int):
+        """Shuffles a new custom question into the unasked part of the deck"""
+        self.custom.insert(random.randint(self.customCursor, len(self.custom)), questionID)
+
+    def insertDefault(self, questionIDs):
+        """Shuffles new default questions into the unasked part of the deck"""
+        for questionID in questionIDs:
+            self.default.insert(random.randint(self.defaultCursor, len(self.default)), questionID)
+            self.defaultHighWater = max(self.defaultHighWater, questionID)
+
+
+class DeckManager:
+    """Deals questions to guilds from a persisted, pre-shuffled deck
+
+    Picking the next question is a primary key read, rather than a random sort of the question pool.
+    Failing to read or write a deck raises, so a database error is never mistaken for an empty deck"""
+
+    def __init__(self, db, corpus):
+        self.db = db
+
+        self.corpus = corpus
+        """The in memory default question pool, default questions are dealt from here"""
+
+        self._locks = defaultdict(asyncio.Lock)
+
+    @property
+    def defaultHighWater(self) -> int:
+        """The largest default question id there is"""
+        return self.corpus.maxID
+
+    async def setup(self):
+        """Makes sure the deck table exists"""
+        await self.db.execute(
+            "CREATE TABLE IF NOT EXISTS QOTDBot.questionDecks ("
+            "guildID VARCHAR(32) NOT NULL PRIMARY KEY, "
+            "customDeck MEDIUMBLOB NOT NULL, "
+            "customCursor INT NOT NULL DEFAULT 0, "
+            "defaultDeck MEDIUMBLOB NOT NULL, "
+            "defaultCursor INT NOT NULL DEFAULT 0, "
+            "defaultHighWater INT NOT NULL DEFAULT 0)"
+        )
+
+    async def _build(self, guildID: int) -> Deck:
+        """Deals a new deck from every question this guild hasn't been asked"""
+        if not self.corpus.loaded:
+            # dealing now would leave out every default question, and they'd never be shuffled in
+            raise RuntimeError("the default questions aren't loaded")
+        custom = await self.db.fetchAll(
+            "SELECT questionID FROM QOTDBot.questions WHERE guildID = %s", (str(guildID),), raiseErrors=True
+        )
+        asked = await self.db.fetchAll(
+            "SELECT questionID FROM QOTDBot.questionLog WHERE guildID = %s", (str(guildID),), raiseErrors=True
+        )
+        asked = {r["questionID"] for r in asked}
+        deck = Deck(guildID)
+        deck.custom = _shuffled(r["questionID"] for r in custom if r["questionID"] not in asked)
+        deck.default = _shuffled(q for q in self.corpus.ids if q not in asked)
+        deck.defaultHighWater = self.defaultHighWater
+        await self._save(deck)
+        log.debug(
+            f"Built deck for {guildID}: {len(deck.custom)} custom, {len(deck.default)} default"
+        )
+        return deck
+
+    async def _save(self, deck: Deck):
+        await self.db.execute(
+            "INSERT INTO QOTDBot.questionDecks "
+            "(guildID, customDeck, customCursor, defaultDeck, defaultCursor, defaultHighWater) "
+            "VALUES (%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE "
+            "customDeck = VALUES(customDeck), customCursor = VALUES(customCursor), "
+            "defaultDeck = VALUES(defaultDeck), defaultCursor = VALUES(defaultCursor), "
+            "defaultHighWater = VALUES(defaultHighWater)",
+            (
+                str(deck.guildID),
+                _pack(deck.custom),
+                deck.customCursor,
+                _pack(deck.default),
+                deck.defaultCursor,
+                deck.defaultHighWater,
+            ),
+            raiseErrors=True,
+        )
+
+    async def _saveCursors(self, deck: Deck):
+        await self.db.execute(
+            "UPDATE QOTDBot.questionDecks SET customCursor = %s, defaultCursor = %s WHERE guildID = %s",
+            (deck.customCursor, deck.defaultCursor, str(deck.guildID)),
+            raiseErrors=True,
+        )
+
+    async def _load(self, guildID: int) -> Deck:
+        """Loads a guild's deck, dealing one if it doesn't have one yet"""
+        row = await self.db.fetchOne(
+            "SELECT * FROM QOTDBot.questionDecks WHERE guildID = %s", (str(guildID),), raiseErrors=True
+        )
+        if row is None:
+            return await self._build(guildID)
+
+        deck = Deck(guildID, row)
+        if deck.defaultHighWater < self.defaultHighWater:
+            # default questions have been added since this deck was dealt
+            deck.insertDefault(self.corpus.idsAbove(deck.defaultHighWater))
+            deck.defaultHighWater = max(deck.defaultHighWater, self.defaultHighWater)
+            await self._save(deck)
+        return deck
+
+    async def peek(self, guildID) -> (tuple, None):
+        """
+        Gets the next question for a guild without using it up
+        :return: (questionID, isCustom) or None if the guild has run out of questions
+        """
+        async with self._locks[int(guildID)]:
+            deck = await self._load(int(guildID))
+            return deck.next()
+
+    async def consume(self, guildID, questionID: int):
+        """Marks a question as asked, moving the guild's deck along"""
+        async with self._locks[int(guildID)]:
+            deck = await self._load(int(guildID))
+            if deck.advance(int(questionID)):
+                await self._saveCursors(deck)
+
+    async def addQuestion(self, guildID, questionID: int):
+        """Shuffles a newly added custom question into a guild's deck
+        If that fails the deck is dropped, and dealt again with this question the next time it is used"""
+        async with self._locks[int(guildID)]:
+            try:
+                row = await self.db.fetchOne(
+                    "SELECT * FROM QOTDBot.questionDecks WHERE guildID = %s", (str(guildID),), raiseErrors=True
+                )
+                if row is None:
+                    # the deck will include this question when it is first dealt
+                    return
+                deck = Deck(int(guildID), row)
+                deck.insertCustom(int(questionID))
+                await self._save(deck)
+            except Exception as e:
+                log.error(f"Failed to add question {questionID} to {guildID}'s deck, dropping it: {e}")
+                await self.db.execute(
+                    "DELETE FROM QOTDBot.questionDecks WHERE guildID = %s", (str(guildID),)
+                )
+
+    async def remaining(self, guildID) -> (int, int):
+        """
+        How many questions a guild has left
+        :return: (custom, default)
+        """
+        async with self._locks[int(guildID)]:
+            deck = await self._load(int(guildID))
+            return deck.remainingCustom, deck.remainingDefault
+
+    async def drop(self, guildID):
+        """Deletes a guild's deck"""
+        await self.db.execute(
+            "DELETE FROM QOTDBot.questionDecks WHERE guildID = %s", (str(guildID),), raiseErrors=True
+        )
+        self._locks.pop(int(guildID), None)
@@ -0,0 +1,129 @@
+import logging
+import sqlite3
+from time import time
+
+from . import utilities
+
+log = utilities.getLog("scheduleStore", logging.INFO)
+
+
+class ScheduleEntry:
+    """When a guild is next due a question"""
+
+    __slots__ = ("guildID", "timeZone", "sendTime", "nextRun", "lastRun")
+
+    def __init__(self, guildID: int, timeZone: str, sendTime: int, nextRun: float, lastRun: float = None):
+        self.guildID = guildID
+        self.timeZone = timeZone
+        self.sendTime = sendTime
+        self.nextRun = nextRun
+        """Unix timestamp of the next send"""
+        self.lastRun = lastRun
+        """Unix timestamp of the last send"""
+
+    def row(self) -> tuple:
+        return self.guildID, self.timeZone, self.sendTime, self.nextRun, self.lastRun
+
+
+class ScheduleStore:
+    """The QOTD schedule, persisted to a local sqlite file so it survives restarts
+
+    Entries are mirrored in memory and bucketed by the minute they are due, so finding due guilds never
+    touches the file"""
+
+    def __init__(self, path: str = "data/schedule.sqlite"):
+        self.path = path
+        self.entries: dict = {}
+        """guild id -> ScheduleEntry"""
+
+        self._buckets: dict = {}
+        """minute (unix time // 60) -> guild ids due in it"""
+
+        self._bucketOf: dict = {}
+        """guild id -> the bucket it is filed under, entries can be changed in place before being re-put"""
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS schedule ("
+            "guildID INTEGER PRIMARY KEY, "
+            "timeZone TEXT NOT NULL, "
+            "sendTime INTEGER NOT NULL, "
+            "nextRun REAL NOT NULL, "
+            "lastRun REAL)"
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, guildID):
+        return int(guildID) in self.entries
+
+    def get(self, guildID) -> (ScheduleEntry, None):
+        return self.entries.get(int(guildID))
+
+    def load(self):
+        """Reads the persisted schedule into memory"""
+        self.entries.clear()
+        self._buckets.clear()
+        self._bucketOf.clear()
+        for row in self._conn.execute(
+            "SELECT guildID, timeZone, sendTime, nextRun, lastRun FROM schedule"
+        ):
+            self._index(ScheduleEntry(*row))
+        log.debug(f"Loaded {len(self.entries)} scheduled guilds from {self.path}")
+
+    def _index(self, entry: ScheduleEntry):
+        self._unindex(entry.guildID)
+        bucket = int(entry.nextRun // 60)
+        self.entries[entry.guildID] = entry
+        self._bucketOf[entry.guildID] = bucket
+        self._buckets.setdefault(bucket, set()).add(entry.guildID)
+
+    def _unindex(self, guildID: int):
+        self.entries.pop(guildID, None)
+        bucket = self._bucketOf.pop(guildID, None)
+        if bucket is not None:
+            guilds = self._buckets.get(bucket)
+            guilds.discard(guildID)
+            if not guilds:
+                del self._buckets[bucket]
+
+    def put(self, *entries: ScheduleEntry):
+        """Adds or replaces entries"""
+        for entry in entries:
+            self._index(entry)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO schedule (guildID, timeZone, sendTime, nextRun, lastRun) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [entry.row() for entry in entries],
+        )
+        self._conn.commit()
+
+    def remove(self, *guildIDs):
+        """Removes guilds from the schedule"""
+        guildIDs = [int(g) for g in guildIDs if int(g) in self.entries]
+        if not guildIDs:
+            return
+        for guildID in guildIDs:
+            self._unindex(guildID)
+        self._conn.executemany(
+            "DELETE FROM schedule WHERE guildID = ?", [(g,) for g in guildIDs]
+        )
+        self._conn.commit()
+
+    def due(self, now: float = None) -> list:
+        """Every entry due at or before now"""
+        minute = int((now or time()) // 60)
+        due = []
+        for bucket in [b for b in self._buckets if b <= minute]:
+            due.extend(self.entries[g] for g in self._buckets[bucket])
+        return due
+
+    def dueAt(self, when: float) -> list:
+        """Every entry due in the same minute as a timestamp"""
+        return [self.entries[g] for g in self._buckets.get(int(when // 60), ())]
+
+    def close(self):
+        self._conn.close()
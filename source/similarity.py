@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import random
+import re
+import zlib
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+from fuzzywuzzy import fuzz
+
+from . import utilities
+
+log = utilities.getLog("similarity", logging.INFO)
+
+shingleSize = 3
+bands = 50
+rows = 2
+"""50 bands of 2 rows puts the LSH threshold near 0.14 jaccard. Short questions that fuzz.ratio scores 80 can share
+few 3-grams, so narrower bands miss them. tests/test_similarity.py checks the recall against fuzz.ratio"""
+
+scanBelow = 250
+"""Guilds with this many questions or fewer are scored against all of them, they're cheap enough to not need LSH"""
+
+# a 31 bit prime keeps a * h + b inside int64, so the permutations can be done in numpy
+_prime = (1 << 31) - 1
+_random = random.Random(0x51A7)
+_a = np.array([_random.randrange(1, _prime) for _ in range(bands * rows)], dtype=np.int64)
+_b = np.array([_random.randrange(0, _prime) for _ in range(bands * rows)], dtype=np.int64)
+
+
+def _normalise(text: str) -> str:
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def shingles(text: str) -> set:
+    """The character n-grams of a piece of text, hashed"""
+    text = _normalise(text)
+    if len(text) <= shingleSize:
+        return {zlib.crc32(text.encode()) % _prime}
+    return {
+        zlib.crc32(text[i: i + shingleSize].encode()) % _prime
+        for i in range(len(text) - shingleSize + 1)
+    }
+
+
+def signature(text: str) -> tuple:
+    """The MinHash signature of a piece of text"""
+    hashes = np.fromiter(shingles(text), dtype=np.int64)
+    return tuple(((_a[:, None] * hashes[None, :] + _b[:, None]) % _prime).min(axis=1).tolist())
+
+
+def _bandKeys(sig: tuple):
+    for band in range(bands):
+        yield band, hash(sig[band * rows: (band + 1) * rows])
+
+
+class GuildIndex:
+    """The LSH buckets for one guild's questions"""
+
+    __slots__ = ("buckets", "signatures", "texts")
+
+    def __init__(self):
+        self.buckets = defaultdict(set)
+        self.signatures = {}
+        self.texts = {}
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, questionID: int, text: str, sig: tuple = None):
+        sig = sig or signature(text)
+        self.signatures[questionID] = sig
+        self.texts[questionID] = text
+        for key in _bandKeys(sig):
+            self.buckets[key].add(questionID)
+
+    def remove(self, questionID: int):
+        sig = self.signatures.pop(questionID, None)
+        self.texts.pop(questionID, None)
+        if sig is None:
+            return
+        for key in _bandKeys(sig):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(questionID)
+                if not bucket:
+                    del self.buckets[key]
+
+    def candidates(self, sig: tuple) -> set:
+        """Questions that share at least one band with a signature"""
+        found = set()
+        for key in _bandKeys(sig):
+            found.update(self.buckets.get(key, ()))
+        return found
+
+
+class SimilarityIndex:
+    """Finds near duplicate questions without comparing against every question a guild has
+
+    Each guild's questions are MinHashed into LSH buckets the first time they are needed, and kept up to
+    date as questions are added. Only questions sharing a bucket are scored with fuzzywuzzy, unless the guild
+    has few enough questions to score them all"""
+
+    def __init__(self, db, maxGuilds: int = 500):
+        self.db = db
+        self.maxGuilds = maxGuilds
+        self._indexes: "OrderedDict[int, GuildIndex]" = OrderedDict()
+        self._locks = defaultdict(asyncio.Lock)
+
+    @staticmethod
+    async def _inExecutor(func, *args):
+        return await asyncio.get_event_loop().run_in_executor(utilities.thread_pool, func, *args)
+
+    async def _get(self, guildID: int) -> GuildIndex:
+        index = self._indexes.get(guildID)
+        if index is not None:
+            self._indexes.move_to_end(guildID)
+            return index
+
+        async with self._locks[guildID]:
+            index = self._indexes.get(guildID)
+            if index is not None:
+                return index
+            # if this fails nothing is cached, an empty index would hide every duplicate until it was evicted
+            questions = await self.db.fetchAll(
+                "SELECT questionID, questionText FROM QOTDBot.questions WHERE guildID = %s",
+                (str(guildID),),
+                raiseErrors=True,
+            )
+
+            def build():
+                _index = GuildIndex()
+                for q in questions:
+                    _index.add(q["questionID"], q["questionText"])
+                return _index
+
+            index = await self._inExecutor(build)
+            self._indexes[guildID] = index
+            while len(self._indexes) > self.maxGuilds:
+                self._indexes.popitem(last=False)
+            log.debug(f"Indexed {len(index)} questions for {guildID}")
+            return index
+
+    async def similar(self, guildID, question: str, threshold: int = 80, limit: int = 3) -> list:
+        """
+        Finds a guild's questions that are similar to the one given
+        :return: up to `limit` question texts, most similar first
+        """
+        index = await self._get(int(guildID))
+        if len(index) <= scanBelow:
+            candidates = list(index.texts.values())
+        else:
+            sig = await self._inExecutor(signature, question)
+            candidates = [index.texts[qid] for qid in index.candidates(sig) if qid in index.texts]
+        if not candidates:
+            return []
+
+        def score():
+            _question = question.lower()
+            results = [(fuzz.ratio(_question, c.lower()), c) for c in candidates]
+            results = [r for r in results if r[0] >= threshold]
+            results.sort(key=lambda r: r[0], reverse=True)
+            return [text for _, text in results[:limit]]
+
+        return await self._inExecutor(score)
+
+    async def add(self, guildID, questionID: int, question: str):
+        """Adds a new question to a guild's index, if it has been built"""
+        index = self._indexes.get(int(guildID))
+        if index is not None:
+            sig = await self._inExecutor(signature, question)
+            index.add(int(questionID), question, sig)
+
+    def remove(self, guildID, questionID: int):
+        """Removes a deleted question from a guild's index"""
+        index = self._indexes.get(int(guildID))
+        if index is not None:
+            index.remove(int(questionID))
+
+    def drop(self, guildID):
+        """Forgets a guild's index entirely"""
+        self._indexes.pop(int(guildID), None)
+        self._locks.pop(int(guildID), None)
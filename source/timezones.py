@@ -0,0 +1,111 @@
+import bisect
+import logging
+from datetime import datetime
+from time import time
+
+import pytz
+
+from . import utilities
+
+log = utilities.getLog("timezones", logging.INFO)
+
+day = 86400
+
+
+class FireTime:
+    """The UTC send time of a (timezone, local hour) pair, valid between two DST transitions"""
+
+    __slots__ = ("timeZone", "hour", "offset", "validFrom", "validUntil")
+
+    def __init__(self, timeZone: str, hour: int, offset: int, validFrom: float, validUntil: float):
+        self.timeZone = timeZone
+        self.hour = hour
+        self.offset = offset
+        """The timezone's utc offset in seconds during this period"""
+        self.validFrom = validFrom
+        self.validUntil = validUntil
+        """The unix timestamp of the next DST transition"""
+
+    def next(self, after: float) -> (float, None):
+        """
+        The first send time after a timestamp
+        :return: a unix timestamp, or None if it falls outside this period
+        """
+        localDay = (after + self.offset) // day * day
+        fire = localDay + self.hour * 3600 - self.offset
+        if fire <= after:
+            fire += day
+        # the day a transition happens on can repeat or skip this hour, so that's left to nextSendTime
+        if self.validFrom <= fire < self.validUntil - day:
+            return fire
+        return None
+
+
+def _period(tz, after: float) -> (int, float, float):
+    """
+    Finds the utc offset in effect at a timestamp, and the DST transitions either side of it
+    :return: (offset, validFrom, validUntil)
+    """
+    offset = int(datetime.fromtimestamp(after, tz).utcoffset().total_seconds())
+    transitions = getattr(tz, "_utc_transition_times", None)
+    if not transitions:
+        # fixed offset zones never change
+        return offset, float("-inf"), float("inf")
+
+    i = bisect.bisect_right(transitions, datetime.utcfromtimestamp(after))
+    validFrom = (
+        transitions[i - 1].replace(tzinfo=pytz.utc).timestamp() if i > 0 else float("-inf")
+    )
+    validUntil = (
+        transitions[i].replace(tzinfo=pytz.utc).timestamp() if i < len(transitions) else float("inf")
+    )
+    return offset, validFrom, validUntil
+
+
+class FireTimeTable:
+    """Precomputed UTC send times for every (timezone, local hour) pair in use
+
+    Guilds sharing a pair share an entry, and an entry is recomputed the first time it is used after the
+    DST transition that ends it, so send times stay correct without a restart"""
+
+    def __init__(self):
+        self.entries: dict = {}
+        """(timezone, hour) -> FireTime"""
+
+        self._zones: dict = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _zone(self, timeZone: str):
+        tz = self._zones.get(timeZone)
+        if tz is None:
+            tz = self._zones[timeZone] = pytz.timezone(timeZone)
+        return tz
+
+    def entry(self, timeZone: str, hour: int, at: float = None) -> FireTime:
+        """Gets the entry for a pair, computing it if it is missing or out of date"""
+        at = time() if at is None else at
+        entry = self.entries.get((timeZone, hour))
+        if entry is None or not entry.validFrom <= at < entry.validUntil:
+            offset, validFrom, validUntil = _period(self._zone(timeZone), at)
+            entry = FireTime(timeZone, hour, offset, validFrom, validUntil)
+            self.entries[(timeZone, hour)] = entry
+        return entry
+
+    def next(self, timeZone: str, hour: int, after: float = None) -> float:
+        """
+        Finds the next send time for a pair
+        :param after: a unix timestamp to search from, defaults to now
+        :return: a unix timestamp
+        """
+        after = time() if after is None else after
+        fire = self.entry(timeZone, hour, after).next(after)
+        if fire is None:
+            # the next send is on the far side of a DST transition
+            fire = utilities.nextSendTime(timeZone, hour, after)
+        return fire
+
+
+fireTimes = FireTimeTable()
+"""The table shared by everything that schedules sends"""
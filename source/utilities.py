@@ -4,7 +4,8 @@ import logging
 import os
 import pickle
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+from datetime import datetime, timedelta
+from time import time
 
 import aiofiles
 import aiohttp
@@ -16,7 +17,6 @@ import scipy.cluster
 from PIL import Image
 from colorlog import ColoredFormatter
 from discord_slash.utils import manage_commands
-from tzlocal import get_localzone
 
 import source.pagination as pagination
 
@@ -41,8 +41,10 @@ logging.Logger.spam = spam
 def getLog(filename, level=logging.DEBUG) -> logging:
     """ Sets up logging, to be imported by other files """
     streamHandler = colorlog.StreamHandler()
+    # clusters all log to the launcher's terminal, so say which one each line came from
+    cluster = f" C{os.environ['QOTD_CLUSTER_ID']}" if "QOTD_CLUSTER_ID" in os.environ else ""
     streamFormatter = ColoredFormatter(
-        "{asctime} {log_color}|| {levelname:^8} || {name:^11s} || {reset}{message}",
+        "{asctime}" + cluster + " {log_color}|| {levelname:^8} || {name:^11s} || {reset}{message}",
         datefmt="%H:%M:%S",
         reset=True,
         log_colors={
@@ -94,6 +96,39 @@ def getToken():
     return token
 
 
+def getShardConfig() -> (int, list):
+    """
+    Reads which shards this process should run from the environment
+    QOTD_SHARD_COUNT is the total number of shards, QOTD_SHARD_IDS is a range like "0-3" or a list like "0,2"
+    :return: (shardCount, shardIDs) either of which may be None, letting discord.py decide
+    """
+    shardCount = os.environ.get("QOTD_SHARD_COUNT")
+    shardIDs = os.environ.get("QOTD_SHARD_IDS")
+    shardCount = int(shardCount) if shardCount else None
+    if shardIDs:
+        if "-" in shardIDs:
+            first, last = shardIDs.split("-")
+            shardIDs = list(range(int(first), int(last) + 1))
+        else:
+            shardIDs = [int(i) for i in shardIDs.split(",")]
+    else:
+        shardIDs = None
+    return shardCount, shardIDs
+
+
+def getClusterConfig() -> (int, int):
+    """
+    Reads which cluster this process is from the environment, set by the cluster launcher
+    :return: (clusterID, clusterCount), (0, 1) if this process isn't part of a cluster
+    """
+    return int(os.environ.get("QOTD_CLUSTER_ID", 0)), int(os.environ.get("QOTD_CLUSTER_COUNT", 1))
+
+
+def getLowMemoryMode() -> bool:
+    """Should the bot run without caching members, set with QOTD_LOW_MEMORY=1"""
+    return os.environ.get("QOTD_LOW_MEMORY", "").lower() in ("1", "true", "yes")
+
+
 def getDiscordBotsToken():
     try:
         file = open("data/DBtoken.pkl", "rb")
@@ -240,18 +275,21 @@ async def checkPermsInChannel(member: discord.Member, channel: discord.TextChann
     return False
 
 
-def convertTime(inputTimezone: str, hour: int) -> datetime:
+def nextSendTime(inputTimezone: str, hour: int, after: float = None) -> float:
     """
-    Converts an input time from timezone to a local time
+    Finds the next time it will be a given hour in a timezone
+    Schedules should use timezones.fireTimes, which precomputes this
     :param inputTimezone: a string of the input timezone
     :param hour: the hour in question
-    :return: datetime
+    :param after: a unix timestamp to search from, defaults to now
+    :return: a unix timestamp
     """
-    local = str(get_localzone())
-    time = datetime.utcnow()
-
-    naiveTime = datetime.strptime(f"{time.year}-{time.month}-{time.day} {hour}:00", "%Y-%m-%d %H:%M")
-    naiveTime = pytz.timezone(inputTimezone).localize(naiveTime)
-
-    localTime = naiveTime.astimezone(pytz.timezone(local))
-    return localTime
+    after = time() if after is None else after
+    tz = pytz.timezone(inputTimezone)
+    localNow = datetime.fromtimestamp(after, tz)
+    for days in range(3):
+        date = localNow.date() + timedelta(days=days)
+        # localize handles the date's own utc offset, so this stays correct across DST changes
+        candidate = tz.localize(datetime(date.year, date.month, date.day, hour)).timestamp()
+        if candidate > after:
+            return candidate
@@ -0,0 +1,53 @@
+import asyncio
+from time import time
+from unittest import mock
+
+from source import dispatcher, scheduleStore
+
+
+class Config:
+    def __init__(self, guildID: int):
+        self.guildID = guildID
+
+
+def makeDispatcher(tmp_path, guildIDs: list) -> dispatcher.QOTDDispatcher:
+    bot = mock.MagicMock()
+    bot.runsGuild.return_value = True
+    bot.ownsGuild.return_value = True
+    bot.guildConfigs.getMany = mock.AsyncMock(side_effect=lambda ids, **kwargs: {g: Config(g) for g in ids})
+    bot.db.execute = mock.AsyncMock()
+
+    async def post(config, questionLog):
+        questionLog.append((1, str(config.guildID), None))
+        return True
+
+    qotd = dispatcher.QOTDDispatcher(bot, post, postsPerSecond=1000, storePath=str(tmp_path / "schedule.sqlite"))
+    for guildID in guildIDs:
+        qotd.schedule(guildID, "Europe/London", 12)
+    return qotd
+
+
+def test_lateSendsAreSkipped(tmp_path):
+    qotd = makeDispatcher(tmp_path, [1, 2])
+    now = time()
+    fresh, late = qotd.store.get(1), qotd.store.get(2)
+    fresh.nextRun = now - 60
+    late.nextRun = now - qotd.misfireGrace - 60
+
+    report = asyncio.run(qotd.runSlot((12, 0), [fresh, late], now))
+    assert report.posted == 1
+    assert qotd.store.get(2).nextRun > now
+    assert qotd.store.get(2).lastRun is None
+
+
+def test_failedLogIsRetriedWithNextSlot(tmp_path):
+    qotd = makeDispatcher(tmp_path, [1, 2])
+    now = time()
+    qotd.bot.db.execute.side_effect = ConnectionError("database is down")
+    asyncio.run(qotd.runSlot((12, 0), [qotd.store.get(1)], now))
+    assert qotd.unlogged == [(1, "1", None)]
+
+    qotd.bot.db.execute.side_effect = None
+    asyncio.run(qotd.runSlot((12, 0), [qotd.store.get(2)], now))
+    assert qotd.unlogged == []
+    assert qotd.bot.db.execute.await_args.args[1] == [1, "1", None, 1, "2", None]
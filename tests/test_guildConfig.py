@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from source.guildConfig import GuildConfigCache
+
+
+class FakeDB:
+    def __init__(self, guildIDs):
+        self.rows = {str(g): {"guildID": str(g), "timeZone": "UTC", "sendTime": 12} for g in guildIDs}
+        self.reads = 0
+        self.failing = False
+
+    def _check(self, raiseErrors: bool) -> bool:
+        if self.failing and raiseErrors:
+            raise ConnectionError("database is down")
+        return self.failing
+
+    async def fetchOne(self, query, args=None, raiseErrors=False):
+        self.reads += 1
+        if self._check(raiseErrors):
+            return None
+        return self.rows.get(args[0])
+
+    async def fetchAll(self, query, args=None, raiseErrors=False):
+        self.reads += 1
+        if self._check(raiseErrors):
+            return []
+        if args is None:
+            return list(self.rows.values())
+        return [self.rows[g] for g in args if g in self.rows]
+
+
+def test_leastRecentlyUsedIsEvicted():
+    db = FakeDB(range(1, 5))
+    cache = GuildConfigCache(db, maxSize=2)
+
+    async def run():
+        await cache.get(1)
+        await cache.get(2)
+        await cache.get(1)
+        await cache.get(3)
+
+    asyncio.run(run())
+    assert 2 not in cache._cache
+    assert {1, 3} <= set(cache._cache)
+
+
+def test_bulkLoadedGuildsAreNeverEvicted():
+    db = FakeDB(range(1, 11))
+    cache = GuildConfigCache(db, maxSize=2, keep=lambda g: g <= 5)
+
+    async def run():
+        assert await cache.loadAll()
+        await cache.getMany(range(6, 11))
+        await cache.get(1)
+
+    asyncio.run(run())
+    assert set(range(1, 6)) <= set(cache._cache)
+    assert len(cache) == 5 + 2
+
+
+def test_failedLoadKeepsCache():
+    db = FakeDB(range(1, 4))
+    cache = GuildConfigCache(db)
+    asyncio.run(cache.loadAll())
+
+    db.failing = True
+    assert not asyncio.run(cache.loadAll())
+    assert len(cache) == 3
+
+
+def test_refreshDropsDeletedGuilds():
+    db = FakeDB(range(1, 4))
+    cache = GuildConfigCache(db)
+    asyncio.run(cache.loadAll())
+
+    del db.rows["2"]
+    asyncio.run(cache.loadAll())
+    assert sorted(c.guildID for c in cache.all()) == [1, 3]
+
+
+def test_getCanRaiseInsteadOfMissing():
+    db = FakeDB([1])
+    db.failing = True
+    cache = GuildConfigCache(db)
+
+    assert asyncio.run(cache.get(1)) is None
+    with pytest.raises(ConnectionError):
+        asyncio.run(cache.get(1, raiseErrors=True))
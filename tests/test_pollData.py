@@ -0,0 +1,97 @@
+import struct
+from datetime import datetime
+
+import pytest
+
+from source import pollData
+from source.pollData import PollData, Option, VoterSet
+
+
+def makePoll(optionCount: int = 3, votersEach: int = 2, **kwargs) -> PollData:
+    poll = PollData(
+        author_id=174918559539920897,
+        title=kwargs.get("title", "Where should we eat? 🍕"),
+        expiry_time=kwargs.get("expiry_time", datetime(2026, 10, 25, 12, 30)),
+        single_vote=kwargs.get("single_vote", True),
+    )
+    poll.message_id = 900000000000000001
+    poll.channel_id = 800000000000000002
+    poll.guild_id = 700000000000000003
+    poll.footer_text = "Asked by someone • Vote below"
+    poll.footer_icon = "https://cdn.discordapp.com/avatars/1/abc.png"
+    for i in range(optionCount):
+        option = Option(f"Option {i} ✨", "1️⃣")
+        option.style = 1 + i % 4
+        option.voters = VoterSet(range(i * votersEach, (i + 1) * votersEach))
+        option.votes = votersEach
+        poll.options.append(option)
+    return poll
+
+
+def assertSamePoll(decoded: PollData, poll: PollData, withVoters: bool = True):
+    for attr in (
+        "title", "expiry_time", "single_vote", "channel_id", "author_id", "message_id",
+        "footer_text", "footer_icon", "guild_id",
+    ):
+        assert getattr(decoded, attr) == getattr(poll, attr), attr
+    assert len(decoded.options) == len(poll.options)
+    for a, b in zip(decoded.options, poll.options):
+        assert (a.text, a.emoji, a.style) == (b.text, b.emoji, b.style)
+        assert list(a.voters) == (list(b.voters) if withVoters else [])
+
+
+def test_roundTrip():
+    poll = makePoll()
+    assertSamePoll(pollData.decode(pollData.encode(poll)), poll)
+
+
+def test_roundTripWithoutVoters():
+    poll = makePoll()
+    assertSamePoll(pollData.decode(pollData.encode(poll, includeVoters=False)), poll, withVoters=False)
+
+
+def test_roundTripWithoutExpiryOrTitle():
+    poll = makePoll(optionCount=0, title="", expiry_time=None, single_vote=False)
+    assertSamePoll(pollData.decode(pollData.encode(poll)), poll)
+
+
+def test_largePollsAreCompressed():
+    poll = makePoll(optionCount=20, votersEach=500)
+    blob = pollData.encode(poll)
+    assert blob[1] & pollData._compressed
+    assert len(blob) < 20 * 500 * 8
+    assertSamePoll(pollData.decode(blob), poll)
+
+
+def test_decodesOlderVersions():
+    poll = makePoll()
+    blob = pollData.encode(poll)
+    # version 2 is version 3 without the guild id after the footer
+    title = pollData._packString(poll.title)
+    footer = pollData._packString(poll.footer_text) + pollData._packString(poll.footer_icon)
+    start = pollData._header.size + pollData._poll.size + len(title) + len(footer)
+    v2 = struct.pack("<BB", 2, 0) + blob[pollData._header.size: start] + blob[start + pollData._guild.size:]
+
+    decoded = pollData.decode(v2)
+    assert decoded.guild_id == 0
+    assert decoded.footer_text == poll.footer_text
+    assert [list(o.voters) for o in decoded.options] == [list(o.voters) for o in poll.options]
+
+
+def test_unknownVersionIsRejected():
+    blob = pollData.encode(makePoll())
+    with pytest.raises(ValueError):
+        pollData.decode(bytes([pollData.version + 1]) + blob[1:])
+
+
+def test_dedupeKeepsFirstChoice():
+    poll = makePoll(votersEach=0)
+    poll.options[0].voters = VoterSet([1, 2])
+    poll.options[1].voters = VoterSet([2, 3])
+    for option in poll.options:
+        option.votes = len(option.voters)
+
+    poll.dedupe()
+    assert list(poll.options[0].voters) == [1, 2]
+    assert list(poll.options[1].voters) == [3]
+    assert poll.total_votes == 3
@@ -0,0 +1,131 @@
+import asyncio
+from unittest import mock
+
+import discord
+
+from source.cogs.polls import Polls
+from source.pollData import PollData, Option
+
+
+def makePoll(messageID: int = 1000, guildID: int = 10) -> PollData:
+    poll = PollData(author_id=1, title="Lunch", poll_options=[Option("Pizza", "1️⃣"), Option("Soup", "2️⃣")])
+    poll.message_id = messageID
+    poll.channel_id = 20
+    poll.guild_id = guildID
+    return poll
+
+
+def makeCog(polls: list, channel=None) -> Polls:
+    bot = mock.MagicMock()
+    bot.messageCache = {}
+    bot.ownsGuild.return_value = True
+    bot.get_channel.return_value = channel
+    bot.getMessage = mock.AsyncMock(return_value=None)
+    cog = Polls(bot)
+
+    cog.store = mock.MagicMock()
+    cog.store.active = {poll.message_id for poll in polls}
+    cog.store.getMany = mock.AsyncMock(side_effect=lambda ids: [p for p in polls if p.message_id in ids])
+    cog.store.counts = mock.AsyncMock(return_value=[3, 1])
+    cog.store.delete = mock.AsyncMock()
+    cog.store.expired = mock.AsyncMock(return_value=[p.message_id for p in polls])
+    cog.store.forgetExpiry = mock.AsyncMock()
+    cog.store.nextExpiry = mock.AsyncMock(return_value=None)
+    cog.archive = mock.MagicMock()
+    cog.archive.archive = mock.AsyncMock()
+    return cog
+
+
+def notFound() -> discord.NotFound:
+    return discord.NotFound(mock.MagicMock(status=404, reason="Not Found"), "Unknown Message")
+
+
+def test_sweepRetiresPollWhoseMessageIsGone():
+    poll = makePoll()
+    channel = mock.MagicMock()
+    channel.fetch_message = mock.AsyncMock(side_effect=notFound())
+    cog = makeCog([poll], channel)
+
+    assert asyncio.run(cog.sweep_polls()) == 1
+    cog.archive.archive.assert_awaited_once_with(poll, [3, 1], poll.guild_id)
+    cog.store.delete.assert_awaited_once_with(poll.message_id)
+
+
+def test_sweepKeepsPollThatFailsToArchive():
+    poll = makePoll()
+    channel = mock.MagicMock()
+    channel.fetch_message = mock.AsyncMock(side_effect=notFound())
+    cog = makeCog([poll], channel)
+    cog.archive.archive.side_effect = RuntimeError("database is down")
+
+    assert asyncio.run(cog.sweep_polls()) == 0
+    cog.store.delete.assert_not_awaited()
+
+
+def test_sweepLeavesPollsWithMessages():
+    poll = makePoll()
+    channel = mock.MagicMock()
+    channel.fetch_message = mock.AsyncMock()
+    cog = makeCog([poll], channel)
+
+    assert asyncio.run(cog.sweep_polls()) == 0
+    cog.archive.archive.assert_not_awaited()
+
+
+def test_closeArchivesPollWithoutMessage():
+    poll = makePoll()
+    cog = makeCog([poll])
+
+    asyncio.run(cog.close_due_polls(now=0))
+    cog.archive.archive.assert_awaited_once_with(poll, [3, 1], poll.guild_id)
+    cog.store.delete.assert_awaited_once_with(poll.message_id)
+    cog.store.forgetExpiry.assert_not_awaited()
+
+
+def test_closeArchivesPollWhoseEditFails():
+    poll = makePoll()
+    message = mock.MagicMock()
+    message.edit = mock.AsyncMock(
+        side_effect=discord.HTTPException(mock.MagicMock(status=503, reason="Unavailable"), "")
+    )
+    cog = makeCog([poll], mock.MagicMock())
+    cog.bot.getMessage.return_value = message
+
+    asyncio.run(cog.close_due_polls(now=0))
+    cog.store.delete.assert_awaited_once_with(poll.message_id)
+
+
+def test_closeRetriesPollThatFailsToArchive():
+    poll = makePoll()
+    message = mock.MagicMock()
+    message.edit = mock.AsyncMock()
+    cog = makeCog([poll], mock.MagicMock())
+    cog.bot.getMessage.return_value = message
+    cog.archive.archive.side_effect = RuntimeError("database is down")
+
+    asyncio.run(cog.close_due_polls(now=0))
+    asyncio.run(cog.close_due_polls(now=0))
+    # kept for the next pass, and its message is only marked closed once
+    assert cog.archive.archive.await_count == 2
+    message.edit.assert_awaited_once()
+    cog.store.delete.assert_not_awaited()
+    cog.store.forgetExpiry.assert_not_awaited()
+
+
+def test_closeForgetsPollWithLapsedKeys():
+    cog = makeCog([])
+    cog.store.expired.return_value = [1000]
+    cog.store.getMany = mock.AsyncMock(return_value=[None])
+
+    asyncio.run(cog.close_due_polls(now=0))
+    cog.store.forgetExpiry.assert_awaited_once_with(1000)
+
+
+def test_resyncDoesNotRepeatExpiries():
+    cog = makeCog([])
+    cog.store.expired.return_value = []
+    cog.store.nextExpiry.return_value = (5000.0, 1000)
+
+    for _ in range(3):
+        asyncio.run(cog.close_due_polls(now=0))
+    assert cog.expiryHeap == [(5000.0, 1000)]
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from source import corpus, questionDeck
+
+
+class FakeDB:
+    """Just enough of DBConnector for decks, backed by dicts"""
+
+    def __init__(self, defaults: dict, custom: dict = None, asked: set = ()):
+        self.defaults = defaults
+        self.custom = custom or {}
+        self.asked = set(asked)
+        self.decks = {}
+        self.failing = False
+
+    def _check(self, raiseErrors: bool):
+        if self.failing:
+            if raiseErrors:
+                raise ConnectionError("database is down")
+            return True
+        return False
+
+    async def fetchOne(self, query, args=None, raiseErrors=False):
+        if self._check(raiseErrors):
+            return None
+        if "questionDecks" in query:
+            row = self.decks.get(args[0])
+            return dict(row) if row else None
+        return {"total": len(self.defaults), "highWater": max(self.defaults, default=0)}
+
+    async def fetchAll(self, query, args=None, raiseErrors=False):
+        if self._check(raiseErrors):
+            return []
+        if "questionLog" in query:
+            return [{"questionID": q} for q in self.asked]
+        if "guildID = '0'" in query:
+            return [{"questionID": q, "questionText": t} for q, t in sorted(self.defaults.items())]
+        return [{"questionID": q} for q in self.custom]
+
+    async def execute(self, query, args=None, raiseErrors=False):
+        if self._check(raiseErrors):
+            return None
+        if query.startswith("INSERT INTO QOTDBot.questionDecks"):
+            keys = ["guildID", "customDeck", "customCursor", "defaultDeck", "defaultCursor", "defaultHighWater"]
+            self.decks[args[0]] = dict(zip(keys, args))
+        elif query.startswith("UPDATE QOTDBot.questionDecks"):
+            self.decks[args[2]].update(customCursor=args[0], defaultCursor=args[1])
+        elif query.startswith("DELETE FROM QOTDBot.questionDecks"):
+            self.decks.pop(args[0], None)
+
+
+def makeDecks(db: FakeDB) -> questionDeck.DeckManager:
+    pool = corpus.DefaultCorpus(db)
+    asyncio.run(pool.load())
+    return questionDeck.DeckManager(db, pool)
+
+
+def dealAll(decks: questionDeck.DeckManager, guildID: int) -> list:
+    async def deal():
+        dealt = []
+        while (nextQuestion := await decks.peek(guildID)) is not None:
+            dealt.append(nextQuestion)
+            await decks.consume(guildID, nextQuestion[0])
+        return dealt
+
+    return asyncio.run(deal())
+
+
+def test_peekDoesNotConsume():
+    decks = makeDecks(FakeDB({1: "a", 2: "b"}))
+    first = asyncio.run(decks.peek(5))
+    assert asyncio.run(decks.peek(5)) == first
+
+
+def test_dealsCustomThenDefaultOnce():
+    db = FakeDB({1: "a", 2: "b", 3: "c"}, custom={10: "x", 11: "y"}, asked={2, 11})
+    decks = makeDecks(db)
+
+    dealt = dealAll(decks, 5)
+    assert dealt[0] == (10, True)
+    assert sorted(q for q, isCustom in dealt[1:]) == [1, 3]
+    assert not any(isCustom for q, isCustom in dealt[1:])
+
+
+def test_consumeIgnoresQuestionsThatArentNext():
+    decks = makeDecks(FakeDB({1: "a", 2: "b"}))
+    questionID, _ = asyncio.run(decks.peek(5))
+    other = 1 if questionID == 2 else 2
+    asyncio.run(decks.consume(5, other))
+    assert asyncio.run(decks.peek(5)) == (questionID, False)
+
+
+def test_newDefaultsAreShuffledIn():
+    db = FakeDB({1: "a", 2: "b"})
+    decks = makeDecks(db)
+    assert asyncio.run(decks.remaining(5)) == (0, 2)
+
+    db.defaults[3] = "c"
+    asyncio.run(decks.corpus.load())
+    assert sorted(q for q, _ in dealAll(decks, 5)) == [1, 2, 3]
+
+
+def test_addQuestionShufflesIntoDeck():
+    db = FakeDB({1: "a"})
+    decks = makeDecks(db)
+    asyncio.run(decks.remaining(5))
+
+    asyncio.run(decks.addQuestion(5, 10))
+    assert asyncio.run(decks.peek(5)) == (10, True)
+
+
+def test_failedReadDoesNotOverwriteDeck():
+    db = FakeDB({1: "a", 2: "b"})
+    decks = makeDecks(db)
+    asyncio.run(decks.consume(5, asyncio.run(decks.peek(5))[0]))
+    saved = dict(db.decks["5"])
+
+    db.failing = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(decks.peek(5))
+    db.failing = False
+    assert db.decks["5"] == saved
+
+
+def test_noDeckIsDealtWithoutDefaults():
+    db = FakeDB({1: "a"})
+    db.failing = True
+    decks = makeDecks(db)
+    db.failing = False
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(decks.peek(5))
+    assert "5" not in db.decks
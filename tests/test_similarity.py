@@ -0,0 +1,101 @@
+import asyncio
+import random
+
+import pytest
+from fuzzywuzzy import fuzz
+
+from source import similarity
+
+_words = (
+    "what is your favourite food colour movie book place the a of to do you would rather if could have be best "
+    "worst thing ever time day most least why how when where who which like think about people life dream job "
+    "pet animal song game holiday summer winter friend family first last remember childhood go travel anywhere "
+    "world superpower eat every rest forever one never again learn skill language"
+).split()
+
+
+def _question(rnd: random.Random) -> str:
+    return (" ".join(rnd.choice(_words) for _ in range(rnd.randint(3, 14))) + "?").capitalize()
+
+
+def _typo(rnd: random.Random, text: str) -> str:
+    chars = list(text)
+    for _ in range(rnd.randint(1, 6)):
+        i = rnd.randrange(len(chars))
+        op = rnd.random()
+        if op < 0.33:
+            chars[i] = rnd.choice("abcdefghijklmnopqrstuvwxyz ")
+        elif op < 0.66:
+            chars.insert(i, rnd.choice("abcdefghijklmnopqrstuvwxyz "))
+        elif len(chars) > 2:
+            del chars[i]
+    text = "".join(chars)
+    if rnd.random() < 0.3:
+        words = text.split()
+        words[rnd.randrange(len(words))] = rnd.choice(_words)
+        text = " ".join(words)
+    return text
+
+
+def nearDuplicates(count: int, threshold: int = 80, seed: int = 1) -> list:
+    """Pairs of short questions that fuzz.ratio scores at or above the threshold"""
+    rnd = random.Random(seed)
+    pairs = []
+    while len(pairs) < count:
+        original = _question(rnd)
+        edited = _typo(rnd, original)
+        if fuzz.ratio(original.lower(), edited.lower()) >= threshold:
+            pairs.append((original, edited))
+    return pairs
+
+
+class FakeDB:
+    def __init__(self, questions: dict):
+        self.questions = questions
+        self.failing = False
+
+    async def fetchAll(self, query, args=None, raiseErrors=False):
+        if self.failing:
+            if raiseErrors:
+                raise ConnectionError("database is down")
+            return []
+        return [{"questionID": q, "questionText": t} for q, t in self.questions.items()]
+
+
+def test_bandsFindWhatFuzzRatioFinds():
+    pairs = nearDuplicates(2000)
+    missed = 0
+    for original, edited in pairs:
+        index = similarity.GuildIndex()
+        index.add(1, original)
+        if 1 not in index.candidates(similarity.signature(edited)):
+            missed += 1
+    # the old 20 x 3 bands missed around 5% of these
+    assert missed / len(pairs) <= 0.005
+
+
+def test_smallGuildsAreScannedInFull():
+    pairs = nearDuplicates(50, seed=2)
+    index = similarity.SimilarityIndex(FakeDB({i: original for i, (original, _) in enumerate(pairs)}))
+    for original, edited in pairs:
+        assert original in asyncio.run(index.similar(5, edited, limit=len(pairs)))
+
+
+def test_largeGuildsFindDuplicates():
+    pairs = nearDuplicates(similarity.scanBelow + 50, seed=3)
+    index = similarity.SimilarityIndex(FakeDB({i: original for i, (original, _) in enumerate(pairs)}))
+    found = sum(
+        original in asyncio.run(index.similar(5, edited, limit=len(pairs))) for original, edited in pairs
+    )
+    assert found / len(pairs) >= 0.99
+
+
+def test_failedReadIsNotCached():
+    db = FakeDB({1: "What is your favourite food?"})
+    index = similarity.SimilarityIndex(db)
+
+    db.failing = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(index.similar(5, "What is your favourite food?"))
+    db.failing = False
+    assert asyncio.run(index.similar(5, "What is your favourite food?")) == ["What is your favourite food?"]
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pytest
+import pytz
+
+from source import timezones, utilities
+
+hour = 3600
+
+
+def _utc(*args) -> float:
+    return datetime(*args, tzinfo=pytz.utc).timestamp()
+
+
+# (timezone, a moment a few days before one of its DST transitions)
+transitions = [
+    ("Europe/London", _utc(2026, 3, 26)),
+    ("Europe/London", _utc(2026, 10, 22)),
+    ("America/New_York", _utc(2026, 3, 5)),
+    ("America/New_York", _utc(2026, 10, 29)),
+    ("Australia/Sydney", _utc(2026, 4, 2)),
+    ("Australia/Lord_Howe", _utc(2026, 10, 1)),
+    ("Asia/Kolkata", _utc(2026, 3, 26)),
+]
+
+
+@pytest.mark.parametrize("timeZone, start", transitions)
+@pytest.mark.parametrize("sendHour", [0, 1, 2, 3, 12, 23])
+def test_matchesLocalisedTimes(timeZone: str, start: float, sendHour: int):
+    table = timezones.FireTimeTable()
+    for step in range(0, 7 * 24 * 4):
+        after = start + step * 900
+        assert table.next(timeZone, sendHour, after) == utilities.nextSendTime(timeZone, sendHour, after)
+
+
+@pytest.mark.parametrize("timeZone, start", transitions)
+@pytest.mark.parametrize("sendHour", [0, 1, 2, 12])
+def test_sendsOncePerDay(timeZone: str, start: float, sendHour: int):
+    table = timezones.FireTimeTable()
+    fires = [table.next(timeZone, sendHour, start)]
+    for _ in range(7):
+        fires.append(table.next(timeZone, sendHour, fires[-1]))
+    dates = [datetime.fromtimestamp(f, pytz.timezone(timeZone)).date() for f in fires]
+    assert len(set(dates)) == len(dates)
+    assert all(20 * hour <= b - a <= 28 * hour for a, b in zip(fires, fires[1:]))
+
+
+def test_entriesAreShared():
+    table = timezones.FireTimeTable()
+    table.next("Europe/London", 12, _utc(2026, 6, 1))
+    table.next("Europe/London", 12, _utc(2026, 6, 2))
+    table.next("Europe/London", 13, _utc(2026, 6, 2))
+    assert len(table) == 2